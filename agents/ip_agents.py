@@ -1,7 +1,11 @@
 from crewai import Agent
 import os
-import json
-from typing import Optional
+import sys
+import hashlib
+import threading
+import numpy as np
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 from tools.custom_tools import (
     IPDataCollectorTool,
     NLPClassificationTool,
@@ -9,7 +13,60 @@ from tools.custom_tools import (
     VisualizationTool,
     LLMTool,
     PDFReportTool,
+    llm_model,
 )
+from tools import json_utils
+
+
+# As ferramentas não guardam estado por execução: uma única instância por processo é
+# compartilhada por todos os agentes, evitando repetir a construção/validação pydantic
+# a cada `IPAgents()` (ex.: um por fluxo no modo batch).
+@lru_cache(maxsize=1)
+def _data_collector_tool() -> IPDataCollectorTool:
+    return IPDataCollectorTool()
+
+
+@lru_cache(maxsize=1)
+def _nlp_classification_tool() -> NLPClassificationTool:
+    return NLPClassificationTool()
+
+
+@lru_cache(maxsize=1)
+def _data_analysis_tool() -> DataAnalysisTool:
+    return DataAnalysisTool()
+
+
+@lru_cache(maxsize=1)
+def _visualization_tool() -> VisualizationTool:
+    return VisualizationTool()
+
+
+@lru_cache(maxsize=1)
+def _llm_tool() -> LLMTool:
+    return LLMTool()
+
+
+@lru_cache(maxsize=1)
+def _pdf_report_tool() -> PDFReportTool:
+    return PDFReportTool()
+
+
+def _light_llm_model() -> str:
+    """Modelo menor usado pelos agentes de classificação e de relatório (LLM_MODEL_LIGHT no .env)."""
+    return os.getenv('LLM_MODEL_LIGHT', 'gpt-4o-mini')
+
+
+# Papéis aceitos por `IPAgents.get_agent_by_role` -> atributo com o agente correspondente.
+# As chaves são internadas para que a consulta reaproveite o hash já calculado.
+_ROLE_ATTRS = {
+    sys.intern(role): attr
+    for role, attr in (
+        ("collector", "data_collector"),
+        ("classifier", "data_classifier"),
+        ("coordinator", "insight_coordinator"),
+        ("relat", "data_relat"),
+    )
+}
 
 
 class IPAgentFactory:
@@ -20,14 +77,11 @@ class IPAgentFactory:
         """Cria o agente coletor de dados de propriedade intelectual."""
         return Agent(
             role='Coletor de Dados de Propriedade Intelectual',
-            goal='Coletar informações abrangentes sobre ativos de propriedade intelectual com base em critérios fornecidos.',
-            backstory='''Você é um especialista em vasculhar vastas quantidades de dados online
-                        para encontrar informações relevantes sobre patentes, modelo de utilidade, desenho industrial, processos, marcas, cultivar e indicação geográfica.
-                        Sua experiência inclui o uso de múltiplas bases de dados e APIs especializadas
-                        em propriedade intelectual.''',
+            goal='Coletar dados de ativos de PI conforme os critérios fornecidos.',
+            backstory='Especialista em busca de PI (patentes, MU, DI, marcas, cultivares, IG) em múltiplas bases e APIs.',
             verbose=True,
             allow_delegation=False,
-            tools=[IPDataCollectorTool()],
+            tools=[_data_collector_tool()],
             max_iter=5,
             memory=True,
         )
@@ -38,12 +92,11 @@ class IPAgentFactory:
         return Agent(
             role='Classificador e Organizador de Dados de Propriedade Intelectual',
             goal='Estruturar e categorizar dados brutos de PI para facilitar a análise posterior.',
-            backstory='''Você é um especialista em transformar dados não estruturados em
-                        informações organizadas e acessíveis, aplicando técnicas avançadas de
-                        processamento de linguagem natural e classificação de dados.''',
+            backstory='Especialista em estruturar e classificar dados brutos de PI com técnicas de PLN.',
             verbose=True,
             allow_delegation=False,
-            tools=[NLPClassificationTool()],
+            tools=[_nlp_classification_tool()],
+            llm=_light_llm_model(),
             max_iter=5,
             memory=True,
         )
@@ -53,15 +106,12 @@ class IPAgentFactory:
         """Cria o agente coordenador de insights."""
         return Agent(
             role='Coordenador de Insights de Propriedade Intelectual',
-            goal='Analisar dados de PI, extrair insights acionáveis e apresentá-los visualmente através de gráficos e dashboards.',
-            backstory='''Você é um analista de dados experiente com paixão por transformar
-                        números complexos em narrativas visuais claras e impactantes. Sua
-                        especialidade é identificar tendências e padrões em dados de propriedade
-                        intelectual e comunicá-los de forma eficaz.''',
+            goal='Extrair insights acionáveis de dados de PI e apresentá-los em gráficos.',
+            backstory='Analista de dados que identifica tendências em PI e as comunica com gráficos claros.',
             verbose=True,
             allow_delegation=True,
-            tools=[DataAnalysisTool(), VisualizationTool(), LLMTool()],
-            max_iter=7,
+            tools=[_data_analysis_tool(), _visualization_tool(), _llm_tool()],
+            max_iter=4,
             memory=True,
         )
 
@@ -71,17 +121,16 @@ class IPAgentFactory:
         # Sempre expor a ferramenta adaptadora `PDFReportTool` (subclasse de BaseTool).
         # Não devemos instanciar `PDFGenerator` diretamente aqui porque ele não herda de BaseTool
         # e causa erro de validação ao construir o Agent (pydantic espera BaseTool/dict).
-        tools_list = [PDFReportTool()]
+        tools_list = [_pdf_report_tool()]
 
         return Agent(
-            role='Gerar relatórios estruturados de informações sobre artigos científicos e ativos de Propriedade Intelectual',
-            goal='Escrever relatórios claros e concisos sobre das informações obtidas de PI para facilitar a análise posterior.',
-            backstory='''Você é um especialista na escrita de relatórios estruturados e detalhados sobre artigos de tecnologia
-                        e de propriedade intelectual. Sua experiência inclui a síntese de informações complexas em formatos
-                        acessíveis aplicando ferramentas de geração de relatórios em formatos pdf, MD e HTML.''',
+            role='Redator de Relatórios de Propriedade Intelectual',
+            goal='Escrever relatórios claros e concisos sobre os dados de PI obtidos.',
+            backstory='Especialista em relatórios estruturados (PDF, MD, HTML) sobre artigos científicos e ativos de PI.',
             verbose=True,
             allow_delegation=False,
             tools=tools_list,
+            llm=_light_llm_model(),
             max_iter=3,
             memory=True,
         )
@@ -90,75 +139,194 @@ class IPAgentFactory:
 class IPAgents:
     """Classe para gerenciar todos os agentes de propriedade intelectual."""
 
+    # Similaridade de cosseno mínima para reaproveitar insights de uma análise quase idêntica
+    INSIGHT_CACHE_SIMILARITY = 0.92
+    # Limites dos caches de insights (entradas mantidas em cada um) e caracteres enviados
+    # ao modelo de embedding
+    INSIGHT_CACHE_MAX_ENTRIES = 256
+    INSIGHT_CACHE_MAX_CHARS = 8000
+    # Quantas listas de classificados pré-serializadas são mantidas
+    CLASSIFIED_CACHE_MAX_ENTRIES = 8
+
     def __init__(self):
         self.data_collector = IPAgentFactory.create_data_collector_agent()
         self.data_classifier = IPAgentFactory.create_data_classifier_agent()
         self.insight_coordinator = IPAgentFactory.create_insight_coordinator_agent()
         # Agente responsável por gerar relatórios/PDFs (pode usar PDFGenerator ou PDFReportTool)
         self.data_relat = IPAgentFactory.create_data_relat_agent()
+        # Mapa papel -> agente montado uma única vez (consultado por get_agent_by_role)
+        self._agents_map = {role: getattr(self, attr) for role, attr in _ROLE_ATTRS.items()}
+        # Índice nome da classe -> ferramenta do coordenador, montado uma única vez
+        # (o Agent é um modelo pydantic, por isso o índice fica nesta classe)
+        self._coordinator_tools = {type(t).__name__: t for t in (self.insight_coordinator.tools or [])}
+        # Cache de insights: acerto exato por hash do payload canônico e, em seguida,
+        # por similaridade de embeddings (entradas: modelo, embedding normalizado, insights)
+        self._insight_exact_cache: Dict[bytes, str] = {}
+        self._insight_cache: List[Tuple[Optional[str], np.ndarray, str]] = []
+        # id(classified) -> (lista, JSON canônico em bytes): a mesma lista reaproveitada em
+        # várias chamadas (ex: rodadas de insights sobre uma mesma busca) é serializada uma vez
+        self._classified_cache: Dict[int, Tuple[list, bytes]] = {}
+        # Uma mesma instância pode ser compartilhada por fluxos em threads diferentes
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def _semantic_cache_enabled() -> bool:
+        """Cache por similaridade é opcional (INSIGHT_SEMANTIC_CACHE=1 no .env); o exato é sempre usado."""
+        return os.getenv('INSIGHT_SEMANTIC_CACHE', '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+    @staticmethod
+    def _summary_for_embedding(analysis: dict) -> str:
+        """Texto comparado no cache semântico: só o resumo da análise, nunca o dump dos classificados.
+
+        Dumps grandes compartilham um prefixo estrutural (chaves e nomes de campos) que deixaria
+        análises sem relação com similaridade alta.
+        """
+        summary = analysis.get('_insights_precomputed') or analysis
+        return json_utils.dumps(summary, sort_keys=True)
+
+    def _embed_for_cache(self, llm_tool, text: str) -> Optional[np.ndarray]:
+        """Retorna o embedding normalizado de `text` ou None se não for possível calculá-lo."""
+        embed = getattr(llm_tool, "_call_openai_embedding", None)
+        if not embed:
+            return None
+        try:
+            vec = np.asarray(embed(text[:self.INSIGHT_CACHE_MAX_CHARS]), dtype=np.float32)
+        except Exception:
+            return None
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else None
+
+    def _find_similar_insight(self, model: Optional[str], embedding: Optional[np.ndarray]) -> Optional[str]:
+        """Procura no cache semântico insights gerados pelo mesmo modelo para um payload similar."""
+        if embedding is None:
+            return None
+        with self._cache_lock:
+            candidates = [(vec, out) for m, vec, out in self._insight_cache if m == model]
+        if not candidates:
+            return None
+        # Vetores já normalizados: o produto escalar é a similaridade de cosseno
+        sims = np.stack([vec for vec, _ in candidates]) @ embedding
+        best = int(np.argmax(sims))
+        if sims[best] >= self.INSIGHT_CACHE_SIMILARITY:
+            return candidates[best][1]
+        return None
+
+    def _serialize_payload(self, analysis: dict, classified: list) -> bytes:
+        """Serializa {analysis, classified} em JSON canônico (chaves ordenadas).
+
+        A parte `classified` (normalmente a maior) vem do cache quando a mesma lista já
+        foi serializada; a lista é tratada como imutável enquanto estiver em uso.
+        """
+        entry = self._classified_cache.get(id(classified))
+        if entry is not None and entry[0] is classified:
+            classified_bytes = entry[1]
+        else:
+            classified_bytes = json_utils.dumps_bytes(classified, sort_keys=True)
+            with self._cache_lock:
+                self._classified_cache[id(classified)] = (classified, classified_bytes)
+                if len(self._classified_cache) > self.CLASSIFIED_CACHE_MAX_ENTRIES:
+                    del self._classified_cache[next(iter(self._classified_cache))]
+        return (
+            b'{"analysis":' + json_utils.dumps_bytes(analysis, sort_keys=True)
+            + b',"classified":' + classified_bytes + b'}'
+        )
+
+    @staticmethod
+    def _exact_cache_key(model: Optional[str], canon: bytes) -> bytes:
+        return hashlib.blake2b(f"{model}\x00".encode("utf-8") + canon, digest_size=16).digest()
+
+    def _store_insight(self, exact_key: bytes, model: Optional[str], embedding: Optional[np.ndarray], insights: str):
+        with self._cache_lock:
+            self._insight_exact_cache[exact_key] = insights
+            if len(self._insight_exact_cache) > self.INSIGHT_CACHE_MAX_ENTRIES:
+                del self._insight_exact_cache[next(iter(self._insight_exact_cache))]
+            if embedding is not None:
+                self._insight_cache.append((model, embedding, insights))
+                if len(self._insight_cache) > self.INSIGHT_CACHE_MAX_ENTRIES:
+                    del self._insight_cache[0]
+
+    def _get_llm_tool(self):
+        """Retorna a ferramenta LLMTool do agente coordenador (ou None)."""
+        return self._coordinator_tools.get("LLMTool")
+
+    @staticmethod
+    def current_llm_model() -> Optional[str]:
+        """Modelo em vigor nesta thread/tarefa: o override de `llm_model` ou LLM_MODEL do ambiente."""
+        current = llm_model.get()
+        return current if current is not None else os.getenv('LLM_MODEL')
+
+    @staticmethod
+    def _apply_model_override(model: Optional[str]):
+        """Resolve o modelo efetivo da invocação e aplica o override em `llm_model` se necessário.
+
+        Se `model` for fornecido (pode ser string vazia) e diferir do modelo em vigor, ele
+        vale apenas para esta invocação via ContextVar; o ambiente do processo nunca é
+        alterado. Retorna (modelo_efetivo, token) — token é None quando nada foi alterado.
+        """
+        current = IPAgents.current_llm_model()
+        if model is None or model == current:
+            return current, None
+        return model, llm_model.set(model)
 
     def generate_insights_via_llm(self, analysis: dict = None, classified: list = None, model: Optional[str] = None) -> Optional[str]:
         """Invoca a LLMTool do agente coordenador sob demanda.
 
         Por padrão (quando `model` for None) a ferramenta LLM usará o valor definido
         na variável de ambiente `LLM_MODEL`. Se `model` for fornecido, ele é aplicado
-        temporariamente na variável de ambiente para esta invocação (override).
+        apenas a esta invocação (override via `llm_model`, sem alterar o ambiente).
+
+        Os resultados ficam em cache por modelo: um payload idêntico (mesmo conteúdo
+        canônico) reaproveita os insights anteriores sem chamar a LLM. Com
+        INSIGHT_SEMANTIC_CACHE habilitado, uma análise cujo resumo seja semanticamente
+        similar (`INSIGHT_CACHE_SIMILARITY`) também reaproveita.
 
         Retorna a string de 'insights' produzida pela LLM ou None se não estiver disponível.
         """
         analysis = analysis or {}
         classified = classified or []
 
-        coord = getattr(self, "insight_coordinator", None)
-        if not coord:
-            return None
-
-        # Localiza uma ferramenta do tipo LLMTool no agente coordenador
-        llm_tool = None
-        for t in getattr(coord, "tools", []) or []:
-            if type(t).__name__ == "LLMTool" or hasattr(t, "_call_openai_chat"):
-                llm_tool = t
-                break
-
+        llm_tool = self._get_llm_tool()
         if not llm_tool:
             return None
 
-        payload = {"analysis": analysis, "classified": classified}
-        # Se um override de modelo foi passado (pode ser string vazia), aplicamos temporariamente
-        # na variável de ambiente; caso contrário, deixamos a variável de ambiente atual.
-        prev_model = None
+        effective_model, token = self._apply_model_override(model)
         try:
-            if model is not None:
-                prev_model = os.getenv('LLM_MODEL')
-                # Se o usuário passou uma string vazia explicitamente, definimos-a tal como foi passada.
-                os.environ['LLM_MODEL'] = model
-
-            # Decide qual modelo será efetivamente usado para esta invocação
-            effective_model = model if model is not None else os.getenv('LLM_MODEL')
-
-            out = llm_tool._run(json.dumps(payload, ensure_ascii=False))
-            # Registra o modelo efetivamente usado no objeto IPAgents para que outras
-            # partes do sistema (ex: geração de relatório) possam consultá-lo.
-            try:
-                self.last_used_llm_model = effective_model
-            except Exception:
-                # Silencioso: não é crítico se não pudermos definir o atributo
-                pass
-            try:
-                parsed = json.loads(out)
-                return parsed.get("insights") if isinstance(parsed, dict) else out
-            except Exception:
-                return out
+            # Payloads equivalentes (mesmo conteúdo, outra ordem de chaves) reaproveitam
+            # os insights já gerados sem uma nova chamada à LLM. O mesmo JSON canônico
+            # serve de chave do cache e de entrada para a ferramenta.
+            canon_bytes = self._serialize_payload(analysis, classified)
+            canon = canon_bytes.decode("utf-8")
+            exact_key = self._exact_cache_key(effective_model, canon_bytes)
+            embedding = None
+            with self._cache_lock:
+                cached = self._insight_exact_cache.get(exact_key)
+            if cached is None and self._semantic_cache_enabled():
+                embedding = self._embed_for_cache(llm_tool, self._summary_for_embedding(analysis))
+                cached = self._find_similar_insight(effective_model, embedding)
+
+            if cached is None:
+                out = llm_tool._run(canon)
+                fallback = False
+                try:
+                    parsed = json_utils.loads(out)
+                    insights = parsed.get("insights") if isinstance(parsed, dict) else out
+                    fallback = isinstance(parsed, dict) and bool(parsed.get("fallback"))
+                except Exception:
+                    insights = out
+                # Insights heurísticos (LLM indisponível no momento) não entram no cache:
+                # a próxima chamada tenta a LLM de novo
+                if insights and not fallback:
+                    self._store_insight(exact_key, effective_model, embedding, insights)
+            else:
+                insights = cached
+
+            return insights
         except Exception:
             return None
 
         finally:
-            # Restaura a variável de ambiente anterior
-            if prev_model is None:
-                if 'LLM_MODEL' in os.environ:
-                    del os.environ['LLM_MODEL']
-            else:
-                os.environ['LLM_MODEL'] = prev_model
+            if token is not None:
+                llm_model.reset(token)
 
     def get_all_agents(self) -> list:
         """Retorna uma lista com todos os agentes."""
@@ -171,12 +339,4 @@ class IPAgents:
 
     def get_agent_by_role(self, role: str) -> Agent:
         """Retorna um agente específico baseado no seu papel."""
-        agents_map = {
-            "collector": self.data_collector,
-            "classifier": self.data_classifier,
-            "coordinator": self.insight_coordinator,
-            "relat": self.data_relat,
-        }
-        print(agents_map)
-        return agents_map.get(role.lower())
-
+        return self._agents_map.get(sys.intern(role.casefold())) if role else None
@@ -6,41 +6,104 @@ Autor: Givasaju
 Versão: 1.0.0
 """
 
-import json
+import asyncio
 import sys
 import os
-import certifi
+import threading
 from collections import Counter
 from dotenv import load_dotenv
-from typing import Dict, Any
-# IMPORTS customizados e suas dependências
-from flows.ip_flow import IPFlowManager
-from agents.ip_agents import IPAgents
-from tasks.ip_tasks import IPTaskManager
-# Adicionar função para carregar regras para possíveis futuras integrações
-from tools.custom_tools import load_category_rules
+from typing import Dict, Any, List
+from tools import json_utils
 
 load_dotenv()
 # Carrega as variáveis de ambiente do arquivo .env
 
-# Configurar certificados SSL
-os.environ['SSL_CERT_FILE'] = certifi.where()
-os.environ['REQUESTS_CA_BUNDLE'] = certifi.where()
-os.environ['CURL_CA_BUNDLE'] = certifi.where()
+
+def _configure_ssl_certs():
+    """Aponta os clientes HTTP para o bundle do certifi, sem sobrescrever uma configuração existente."""
+    if 'SSL_CERT_FILE' in os.environ:
+        return
+    import certifi
+    ca_bundle = certifi.where()
+    os.environ['SSL_CERT_FILE'] = ca_bundle
+    os.environ.setdefault('REQUESTS_CA_BUNDLE', ca_bundle)
+    os.environ.setdefault('CURL_CA_BUNDLE', ca_bundle)
+
+
+def _in_daemon_thread(func, *args) -> asyncio.Future:
+    """Executa `func(*args)` em uma thread daemon e devolve um future do loop corrente.
+
+    Ao contrário de `asyncio.to_thread`, a thread não é aguardada no encerramento do
+    `asyncio.run`: um Ctrl+C encerra o processo mesmo com um `input()` pendente ou uma
+    análise em andamento.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def _settle(result, exc):
+        if future.done():  # cancelado enquanto a thread executava
+            return
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+    def _target():
+        try:
+            outcome = (func(*args), None)
+        except BaseException as exc:
+            outcome = (None, exc)
+        try:
+            loop.call_soon_threadsafe(_settle, *outcome)
+        except RuntimeError:
+            pass  # loop já encerrado
+
+    threading.Thread(target=_target, daemon=True).start()
+    return future
+
+
+def _read_line(prompt: str) -> str:
+    """Equivalente a `input()` que lê direto do descritor de stdin.
+
+    Feito para rodar em `_in_daemon_thread`: sem o lock do buffer de `sys.stdin`, uma
+    leitura pendente não trava o encerramento do interpretador após um Ctrl+C.
+    """
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    line = bytearray()
+    while True:
+        char = os.read(sys.stdin.fileno(), 1)
+        if not char:
+            if not line:
+                raise EOFError
+            break
+        if char == b'\n':
+            break
+        line += char
+    return line.decode(sys.stdin.encoding or 'utf-8', errors='replace').rstrip('\r')
+
 
 class IPAnalysisSystem:
     """Sistema principal para análise de propriedade intelectual."""
 
     def __init__(self, category_rules_file: str = "category_rules.json"):
         """Inicializa o sistema com gerenciadores de fluxo, agentes e tarefas."""
+        # Imports pesados (crewAI, ferramentas, banco) só quando o sistema é de fato
+        # construído: a mensagem de uso da CLI não paga esse custo.
+        from flows.ip_flow_manager import IPFlowManager
+        from agents.ip_agents import IPAgents
+        from tasks.ip_tasks import IPTaskManager
+        from tools.custom_tools import load_category_rules
+
+        _configure_ssl_certs()
         self.flow_manager = IPFlowManager()
         self.agents = IPAgents()
         self.task_manager = IPTaskManager(self.agents)
         self.category_rules_file = category_rules_file
         self.category_rules = load_category_rules(self.category_rules_file)
 
-    def run_analysis(self, search_criteria: str, flow_id: str = None) -> Dict[str, Any]:
-        """Executa uma análise completa de propriedade intelectual."""
+    def _start_flow(self, search_criteria: str, flow_id: str = None) -> str:
+        """Registra um novo fluxo para o critério informado e retorna seu ID."""
         print(f"Executando análise para o critério: {search_criteria}")
         if not flow_id:
             flow_id = f"ip_flow_{len(self.flow_manager.active_flows) + 1}"
@@ -50,22 +113,37 @@ class IPAnalysisSystem:
         print(f"🆔 ID do fluxo: {flow_id}")
         print("=" * 60)
 
-        # Cria e executa o fluxo
-        flow = self.flow_manager.create_flow(flow_id, search_criteria)
-        result = self.flow_manager.execute_flow(flow_id)
+        self.flow_manager.create_flow(flow_id, search_criteria)
+        return flow_id
 
-        # Extrai categorias classificadas e gera resumo
+    def _add_category_summary(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Extrai categorias classificadas e gera resumo."""
+        # O relatório final do fluxo já traz 'classified_data' desserializado; a string
+        # JSON só é aceita por compatibilidade e é decodificada uma única vez.
+        classified = result.get('classified_data') or []
         try:
-            classified_json = result.get('classified_data', '[]')
-            classified_data = json.loads(classified_json)
-            categories = [item.get('category', 'Outros') for item in classified_data if isinstance(item, dict)]
-            category_counts = dict(Counter(categories))
-            result['category_summary'] = category_counts
+            if isinstance(classified, str):
+                classified = json_utils.loads(classified)
+            result['category_summary'] = dict(Counter(
+                item.get('category', 'Outros') for item in classified if isinstance(item, dict)
+            ))
         except Exception as e:
             result['category_summary_error'] = str(e)
 
         return result
 
+    def run_analysis(self, search_criteria: str, flow_id: str = None) -> Dict[str, Any]:
+        """Executa uma análise completa de propriedade intelectual."""
+        flow_id = self._start_flow(search_criteria, flow_id)
+        result = self.flow_manager.execute_flow(flow_id)
+        return self._add_category_summary(result)
+
+    async def run_analysis_async(self, search_criteria: str, flow_id: str = None) -> Dict[str, Any]:
+        """Versão assíncrona de `run_analysis`, usada pelo modo batch."""
+        flow_id = self._start_flow(search_criteria, flow_id)
+        result = await self.flow_manager.execute_flow_async(flow_id)
+        return self._add_category_summary(result)
+
     def _display_results(self, result: Dict[str, Any]):
         """Exibe os resultados da análise."""
         print("\n" + "=" * 60)
@@ -102,64 +180,163 @@ class IPAnalysisSystem:
 
         print("=" * 60)
 
-    def run_batch_mode(self, config_file: str):
-        """Executa o sistema em modo batch usando arquivo de configuração."""
+    @staticmethod
+    def _criteria_key(criteria) -> str:
+        """Critério canônico de uma busca (sem espaços nas bordas e sem diferença de caixa)."""
+        return str(criteria or '').strip().casefold()
+
+    @staticmethod
+    def _load_batch_checkpoint(output_file: str) -> set:
+        """Lê o arquivo JSONL de saída e retorna os critérios canônicos já concluídos com sucesso.
+
+        Entradas com erro (no topo ou dentro de 'result', como o devolvido por
+        `IPFlowManager.execute_flow`) não contam como concluídas e serão reexecutadas.
+        """
+        done = set()
+        if not os.path.exists(output_file):
+            return done
+        with open(output_file, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json_utils.loads(line)
+                except json_utils.JSONDecodeError:
+                    # Linha truncada (ex: queda no meio da escrita): será reprocessada
+                    continue
+                if not isinstance(entry, dict) or 'criteria_key' not in entry or entry.get('error'):
+                    continue
+                result = entry.get('result')
+                if isinstance(result, dict) and result.get('error'):
+                    continue
+                done.add(entry['criteria_key'])
+        return done
+
+    async def run_batch_mode_async(self, config_file: str, max_concurrency: int = None):
+        """Executa o modo batch disparando as buscas de forma concorrente.
+
+        O trabalho de cada fluxo é dominado por I/O (APIs de busca, LLM e banco), então
+        as análises são executadas em paralelo, limitadas por `max_concurrency`
+        (parâmetro ou chave 'max_concurrency' do arquivo de configuração).
+
+        Cada resultado é gravado no arquivo JSONL de saída assim que fica pronto; ao
+        reexecutar o mesmo batch, os critérios já concluídos com sucesso no arquivo são
+        pulados (a retomada não depende da posição da busca na configuração).
+        Buscas com o mesmo critério (ignorando espaços nas bordas e caixa) são
+        executadas uma única vez e o resultado é replicado para cada flow_id.
+        """
         try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            with open(config_file, 'rb') as f:
+                config = json_utils.loads(f.read())
+
+            searches = config.get('searches', [])
+            limit = max_concurrency or config.get('max_concurrency', 4)
+            semaphore = asyncio.Semaphore(max(1, int(limit)))
+
+            output_file = config.get('output_file', 'batch_results.jsonl')
+            done = self._load_batch_checkpoint(output_file)
+            if done:
+                print(f"♻️ Retomando batch: {len(done)} busca(s) já concluída(s) em {output_file}")
 
-            results = []
-            for i, search_config in enumerate(config.get('searches', [])):
+            # Agrupa os índices pendentes por critério canônico, preservando a ordem original
+            groups: Dict[str, List[int]] = {}
+            for i, search_config in enumerate(searches):
+                key = self._criteria_key(search_config.get('criteria', ''))
+                if key in done:
+                    continue
+                groups.setdefault(key, []).append(i)
+
+            duplicates = sum(len(indices) - 1 for indices in groups.values())
+            if duplicates:
+                print(f"🔁 {duplicates} busca(s) duplicada(s) reaproveitarão o resultado de outra execução")
+
+            async def _run_group(key: str, indices: List[int]) -> List[Dict[str, Any]]:
+                i = indices[0]
                 flow_id = f"batch_flow_{i+1}"
-                search_criteria = search_config.get('criteria', '')
-                print(f"\n🔄 Processando busca {i+1}/{len(config['searches'])}")
-                result = self.run_analysis(search_criteria, flow_id)
-                results.append(result)
+                async with semaphore:
+                    print(f"\n🔄 Processando busca {i+1}/{len(searches)}")
+                    try:
+                        result = await self.run_analysis_async(searches[i].get('criteria', ''), flow_id)
+                        outcome = {"result": result}
+                        # Falhas capturadas pelo fluxo voltam como {"error": ...}: ficam no topo
+                        if isinstance(result, dict) and result.get('error'):
+                            outcome["error"] = result['error']
+                    except Exception as e:
+                        outcome = {"error": str(e)}
+                return [{"flow_id": f"batch_flow_{j+1}", "criteria_key": key, **outcome} for j in indices]
+
+            pending = [_run_group(key, indices) for key, indices in groups.items()]
 
-            output_file = config.get('output_file', 'batch_results.json')
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
+            with open(output_file, 'ab') as out:
+                for next_done in asyncio.as_completed(pending):
+                    entries = await next_done
+                    out.write(b''.join(json_utils.dumps_bytes(entry) + b'\n' for entry in entries))
+                    out.flush()
+                    os.fsync(out.fileno())
 
             print(f"\n✅ Resultados salvos em: {output_file}")
 
         except FileNotFoundError:
             print(f"❌ Arquivo de configuração não encontrado: {config_file}")
-        except json.JSONDecodeError:
+        except json_utils.JSONDecodeError:
             print(f"❌ Erro ao ler arquivo JSON: {config_file}")
         except Exception as e:
             print(f"❌ Erro no modo batch: {str(e)}")
 
-    def run_interactive_mode(self):
-        """Executa o sistema em modo interativo."""
+    def run_batch_mode(self, config_file: str, max_concurrency: int = None):
+        """Executa o sistema em modo batch usando arquivo de configuração."""
+        asyncio.run(self.run_batch_mode_async(config_file, max_concurrency))
+
+    async def run_interactive_mode_async(self):
+        """Executa o modo interativo sem bloquear o prompt durante as análises.
+
+        Cada critério digitado dispara sua análise em segundo plano e o prompt volta
+        imediatamente, de modo que o próximo critério pode ser digitado enquanto a
+        anterior ainda executa; os resultados são exibidos assim que ficam prontos.
+        """
         print("\n🤖 Sistema de Análise de Propriedade Intelectual")
         print("=" * 50)
         print("Digite 'quit' para sair")
 
-        while True:
+        pending = set()
+
+        async def _analyze(search_criteria: str):
             try:
-                search_criteria = input("\n📝 Digite os critérios de busca: ").strip()
+                result = await _in_daemon_thread(self.run_analysis, search_criteria) # Executa análise com critérios fornecidos
+                self._display_results(result)
+            except Exception as e:
+                print(f"\n❌ Erro inesperado: {str(e)}")
+
+        try:
+            while True:
+                search_criteria = (await _in_daemon_thread(_read_line, "\n📝 Digite os critérios de busca: ")).strip()
                 if search_criteria.lower() in ['quit', 'exit', 'sair']:
+                    if pending:
+                        print(f"⏳ Aguardando {len(pending)} análise(s) em andamento...")
+                        await asyncio.gather(*pending)
                     print("👋 Encerrando sistema...")
                     break
                 if not search_criteria:
                     print("⚠️ Por favor, digite critérios de busca válidos.")
                     continue
 
-                result = self.run_analysis(search_criteria) # Executa análise com critérios fornecidos
-                self._display_results(result)
+                task = asyncio.create_task(_analyze(search_criteria))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except EOFError:
+            print("\n\n👋 Sistema interrompido pelo usuário.")
 
-            except KeyboardInterrupt:
-                print("\n\n👋 Sistema interrompido pelo usuário.")
-                break
-            except Exception as e:
-                print(f"\n❌ Erro inesperado: {str(e)}")
+    def run_interactive_mode(self):
+        """Executa o sistema em modo interativo."""
+        try:
+            asyncio.run(self.run_interactive_mode_async())
+        except KeyboardInterrupt:
+            print("\n\n👋 Sistema interrompido pelo usuário.")
 
 def main():
-    system = IPAnalysisSystem()
     if len(sys.argv) > 1:
         if sys.argv[1] == '--batch' and len(sys.argv) > 2:
-            system.run_batch_mode(sys.argv[2])
+            IPAnalysisSystem().run_batch_mode(sys.argv[2])
         elif sys.argv[1] == '--single' and len(sys.argv) > 2:
+            system = IPAnalysisSystem()
             search_criteria = ' '.join(sys.argv[2:])
             result = system.run_analysis(search_criteria)
             system._display_results(result)
@@ -169,7 +346,7 @@ def main():
             print(" python main.py --single \"<critério>\"  # Busca única")
             print(" python main.py --batch <arquivo_config.json>  # Modo batch")
     else:
-        system.run_interactive_mode()
+        IPAnalysisSystem().run_interactive_mode()
 
 if __name__ == "__main__":
     main()
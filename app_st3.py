@@ -4,34 +4,451 @@
 import streamlit as st
 import pandas as pd
 import os
+import re
+import html
 import sys
+import atexit
+from contextlib import contextmanager
 from typing import Dict, Any
-import json
 from datetime import datetime
-from database.persist_dados import BuscapiDB
-import plotly.express as px
-import plotly.io as pio
-import plotly.graph_objects as go
+from functools import lru_cache
+from pathlib import Path
+from database.persist_dados import BuscapiDB, create_connection_pool
 import traceback
 
-# Adiciona o diretório raiz do projeto ao path para garantir que as importações funcionem
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
 # Importa o serviço de análise que usa o fluxo com persistência
 from flows.ip_flow import IPAnalysisService
-from tasks.pdf_worker import enqueue_pdf_job, get_job_meta
+from tasks.pdf_worker import enqueue_pdf_job, get_job_meta, list_jobs_for_query
 
 from agents.ip_agents import IPAgents
+from tools import json_utils
+from tools.figure_utils import to_figure
+
+# Modelos oferecidos no seletor da barra lateral ('Env default' usa o LLM_MODEL do .env)
+LLM_OPTIONS = (
+    'Env default',
+    'gpt-5-nano',
+    'gpt-4o-mini',
+    'gpt-4o',
+    'gpt-4o-realtime-preview',
+    'gpt-4',
+    'gpt-3.5-turbo',
+)
+LLM_INDEX = {m: i for i, m in enumerate(LLM_OPTIONS)}
+
+# Intervalos (s) de atualização dos fragmentos periódicos
+PDF_STATUS_POLL_SECONDS = 2
+HISTORY_STATS_REFRESH_SECONDS = 30
+
+# Configuração da página e CSS, montados uma vez por processo
+PAGE_CONFIG = dict(
+    page_title="Análise de Propriedade Intelectual",
+    page_icon="🔍",
+    layout="wide",
+    initial_sidebar_state="expanded",
+)
+CUSTOM_CSS = """
+<style>
+    /* Botões com largura total dentro das colunas */
+    div.stButton > button {
+        width: 100%;
+        height: 100%;
+    }
+    /* Card para o histórico */
+    .card {
+        background-color: #e6f3ff; /* Azul suave */
+        border: 1px solid #b8d8f5;
+        border-radius: 7px;
+        padding: 15px;
+        margin-bottom: 10px;
+        box-shadow: 0 1px 3px rgba(0,0,0,0.12), 0 1px 2px rgba(0,0,0,0.24);
+    }
+    /* Divisor customizado */
+    hr.styled-divider {
+        border-top: 20px solid yellow;
+        border-radius: 5px;
+    }
+</style>
+"""
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def build_figure_cached(viz_json_str):
+    """Constrói a figura a partir do JSON bruto, reaproveitando-a entre reruns do Streamlit.
+
+    Usa `cache_resource` (e não `cache_data`) para devolver o mesmo objeto sem o custo de
+    copiá-lo via pickle a cada acesso; as figuras não são modificadas depois de criadas.
+    """
+    return to_figure(viz_json_str)
+
+
+def normalize_visualizations(visualizations) -> Dict[str, bytes]:
+    """Normaliza as visualizações do fluxo para {nome: JSON da figura em bytes}.
+
+    Feito uma única vez ao receber os resultados: strings são apenas codificadas, dicts
+    serializados e listas de traces embrulhadas em {'data': ...}. A renderização e a
+    exportação passam a lidar com um único formato, aceito diretamente por `pio.from_json`.
+    """
+    normalized = {}
+    if not isinstance(visualizations, dict):
+        return normalized
+    for viz_name, viz in visualizations.items():
+        if isinstance(viz, bytes):
+            normalized[viz_name] = viz
+        elif isinstance(viz, str):
+            normalized[viz_name] = viz.encode('utf-8')
+        elif isinstance(viz, dict):
+            normalized[viz_name] = json_utils.dumps_bytes(viz)
+        elif isinstance(viz, list):
+            normalized[viz_name] = json_utils.dumps_bytes({'data': viz})
+    return normalized
+
+
+@st.cache_resource(show_spinner=False)
+def _db_pool():
+    # Compartilhado entre sessões e reruns: cada acesso empresta uma conexão já aberta
+    pool = create_connection_pool(minconn=1, maxconn=8)
+    atexit.register(pool.closeall)
+    return pool
+
+
+# Análises seguram uma conexão durante todo o fluxo (minutos): ficam em um pool próprio,
+# para não esgotar o da UI; além deste limite, novas análises aguardam uma conexão livre
+ANALYSIS_MAX_CONCURRENT = int(os.getenv('ANALYSIS_MAX_CONCURRENT', '4'))
+
+
+@st.cache_resource(show_spinner=False)
+def _analysis_service():
+    pool = create_connection_pool(minconn=1, maxconn=ANALYSIS_MAX_CONCURRENT)
+    atexit.register(pool.closeall)
+    return IPAnalysisService(db_pool=pool)
+
+
+@contextmanager
+def shared_db():
+    """Fornece um BuscapiDB sobre uma conexão emprestada do pool, devolvida ao final."""
+    pool = _db_pool()
+    conn = pool.getconn()
+    if conn.closed:
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    db = BuscapiDB(conn=conn)
+    try:
+        yield db
+    finally:
+        db.close()
+        pool.putconn(conn)
+
+
+# Colunas exibidas na tabela do histórico
+HISTORY_VIEW_COLUMNS = ['id', 'criteria', 'created_at', 'status', 'created_at_str']
+# Registros do histórico por página (filtro, ordenação e paginação ficam no SQL)
+HISTORY_PAGE_SIZE = 20
+# Colunas visíveis (na ordem) da tabela do histórico; specs do st.column_config não têm estado
+HISTORY_COLUMN_CONFIG = {
+    'id': st.column_config.NumberColumn("ID", format="%d"),
+    'criteria': "Critério",
+    'created_at': st.column_config.DatetimeColumn("Data", format="DD/MM/YYYY HH:mm"),
+    'status': "Status",
+}
+
+
+def _history_filters(date_filter, status_filter: str) -> dict:
+    return {'date': date_filter or None, 'status': None if status_filter == "Todos" else status_filter}
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_history_view(date_filter, status_filter: str, page: int = 0) -> pd.DataFrame:
+    """Uma página do histórico já filtrada pelo banco, em cache por filtros/página (30s).
+
+    A página traz as buscas mais recentes primeiro e é exibida em ordem crescente de
+    data; `clear_history_cache()` força a recarga (ex: botão "Atualizar Lista").
+    """
+    with shared_db() as db:
+        rows = db.get_search_queries(limit=HISTORY_PAGE_SIZE, offset=page * HISTORY_PAGE_SIZE,
+                                     **_history_filters(date_filter, status_filter))
+    df = pd.DataFrame(rows or [], columns=['id', 'criteria', 'created_at', 'status'])
+    created_at = df['created_at']
+    # O psycopg2 já devolve `datetime` (coluna datetime64): nada a converter. Para
+    # valores em texto, usa o formato explícito (parser rápido, sem inferência).
+    if not pd.api.types.is_datetime64_any_dtype(created_at):
+        created_at = pd.to_datetime(created_at, format='%Y-%m-%d %H:%M:%S.%f', errors='coerce', cache=True)
+    df['created_at'] = created_at
+    df['created_at_str'] = created_at.dt.strftime('%d/%m/%Y %H:%M')
+    return df.iloc[::-1].reset_index(drop=True)[HISTORY_VIEW_COLUMNS]
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def count_history(date_filter, status_filter: str) -> int:
+    """Total de buscas com os filtros informados (em cache por 30s)."""
+    with shared_db() as db:
+        return db.count_search_queries(**_history_filters(date_filter, status_filter))
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_history_stats() -> dict:
+    """Total de buscas e buscas dos últimos 7 dias (um único agregado no banco, em cache por 30s)."""
+    with shared_db() as db:
+        return db.get_history_stats(recent_days=7)
+
+
+def clear_history_cache():
+    """Descarta o histórico em cache (ex: nova busca registrada ou "Atualizar Lista")."""
+    load_history_view.clear()
+    count_history.clear()
+    load_history_stats.clear()
+
+
+# Chaves do structured_json usadas na tela de detalhes (o restante não sai do banco)
+DETAILS_FIELDS = (
+    'category', 'title', 'applicantName', 'snippet', 'abstract', 'applicationNumber',
+    'publicationNumber', 'source', 'link', 'url', 'ipcCode', 'filingDate', 'publicationDate',
+    'date', 'extracted_organizations', 'extracted_persons',
+)
+# Campos com valores muito repetidos entre resultados
+_INTERNED_FIELDS = ('category', 'source', 'applicantName')
+# Itens lidos do banco e exibidos inicialmente (e a cada "Mostrar mais") em cada categoria
+DETAILS_CATEGORY_STEP = 10
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_category_counts(query_id: int) -> list:
+    """Quantidade de resultados estruturados por categoria, agregada no banco (em cache por 60s)."""
+    with shared_db() as db:
+        return db.get_category_counts(query_id)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_query_info(query_id: int) -> dict:
+    """Dados da busca (critério, status...) em cache por 5min."""
+    with shared_db() as db:
+        return db.get_search_query_by_id(query_id)
+
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def fetch_category_results(query_id: int, category: str, offset: int) -> list:
+    """Lê e prepara para exibição um bloco de `DETAILS_CATEGORY_STEP` resultados de uma categoria.
+
+    Os resultados de uma busca concluída não mudam: ficam em cache por 1h, com número
+    de blocos limitado para conter a memória. Reruns da tela de detalhes não voltam ao
+    banco nem refazem a preparação (datas, entidades); "Mostrar mais" lê só o bloco seguinte.
+    """
+    with shared_db() as db:
+        rows = db.get_structured_results_by_query_id(
+            query_id, limit=DETAILS_CATEGORY_STEP, offset=offset, fields=DETAILS_FIELDS, category=category
+        )
+    # Valores que se repetem entre os resultados passam a ser um único objeto, o que
+    # também encolhe a cópia (pickle) que o cache_data guarda e devolve a cada rerun
+    for row in rows:
+        for key in _INTERNED_FIELDS:
+            value = row.get(key)
+            if type(value) is str:
+                row[key] = sys.intern(value)
+        # Entidades extraídas já unidas (sem repetições) uma vez, e não a cada rerun
+        row['_orgs'] = _join_unique(row.get('extracted_organizations'))
+        row['_persons'] = _join_unique(row.get('extracted_persons'))
+    # Datas formatadas de uma vez por coluna, também guardadas no cache
+    pub_dates = format_dates([r.get('publicationDate') or r.get('date') for r in rows])
+    filing_dates = format_dates([r.get('filingDate') for r in rows])
+    for row, pub_str, filing_str in zip(rows, pub_dates, filing_dates):
+        row['_pub_fmt'] = pub_str
+        row['_filing_fmt'] = filing_str
+    return rows
+
+
+def _join_unique(values) -> str:
+    return ', '.join(dict.fromkeys(map(str, values))) if values else ''
+
+
+# Colunas do modo compacto (tabela) da tela de detalhes
+DETAILS_TABLE_FIELDS = ('category', 'title', 'applicantName', 'source', 'publicationDate', 'link')
+DETAILS_COLUMN_CONFIG = {
+    'category': "Categoria",
+    'title': "Título",
+    'applicantName': "Requerente",
+    'source': "Fonte",
+    'publicationDate': "Data de Publicação",
+    'link': st.column_config.LinkColumn("Documento"),
+}
+
+
+@st.cache_data(ttl=3600, max_entries=16, show_spinner=False)
+def fetch_results_table(query_id: int) -> pd.DataFrame:
+    """Todos os resultados estruturados de uma busca, só com as colunas da tabela (em cache por 1h)."""
+    with shared_db() as db:
+        rows = db.get_structured_results_by_query_id(query_id, fields=DETAILS_TABLE_FIELDS)
+    return pd.DataFrame(rows, columns=list(DETAILS_TABLE_FIELDS))
+
+
+# pandas 2 aceita formatos heterogêneos na mesma coluna só com format='mixed'
+_MIXED_DATES = {'format': 'mixed'} if int(pd.__version__.split('.')[0]) >= 2 else {}
+
+
+def format_dates(values: list) -> list:
+    """Formata uma coluna de datas como dd/mm/aaaa com uma única chamada ao pandas.
+
+    Valores vazios viram 'N/A'; valores que não são datas são exibidos como vieram.
+    """
+    series = pd.Series(values, dtype=object)
+    try:
+        formatted = pd.to_datetime(series, errors='coerce', **_MIXED_DATES).dt.strftime('%d/%m/%Y')
+    except (ValueError, TypeError):
+        # ex: fusos horários misturados; cai para `format_date` valor a valor
+        formatted = pd.Series([None] * len(series), dtype=object)
+    out = []
+    for raw, fmt in zip(values, formatted):
+        if not raw:
+            out.append('N/A')
+        elif isinstance(fmt, str):
+            out.append(fmt)
+        else:
+            out.append(format_date(raw))
+    return out
+
+
+@lru_cache(maxsize=4096)
+def format_date(value) -> str:
+    """Formata uma data ISO-8601 (str, date ou datetime) como dd/mm/aaaa, sem passar pelo pandas (memoizada)."""
+    if not value:
+        return 'N/A'
+    try:
+        return datetime.fromisoformat(str(value)).strftime('%d/%m/%Y')
+    except ValueError:
+        return str(value)
+
+
+def _html_field(label: str, value) -> str:
+    return f"<b>{label}:</b> {html.escape(str(value))}"
+
+
+def result_markdown(i: int, result: dict) -> str:
+    """Monta o bloco (markdown + HTML das duas colunas) de um resultado da tela de detalhes.
+
+    Usa os campos pré-calculados em `fetch_category_results` (_orgs, _persons, _pub_fmt, _filing_fmt).
+    """
+    parts = []
+    # Exibe as novas entidades extraídas
+    organizations = result.get('_orgs')
+    persons = result.get('_persons')
+    if organizations:
+        parts.append(f"**🏢 Organizações Identificadas:** ` {organizations} `")
+    if persons:
+        parts.append(f"**👤 Pessoas/Inventores Identificados:** ` {persons} `")
+
+    parts.append(f"**{i+1}. {result.get('title', 'Título não disponível')}**")
+    parts.append(f"**Fonte:** {result.get('source', 'Desconhecida')}")
+
+    left = [_html_field("Requerente", result.get('applicantName', 'Não informado'))]
+    if result.get('applicationNumber'):
+        left.append(_html_field("Nº do Pedido", result['applicationNumber']))
+    if result.get('publicationNumber'):
+        left.append(_html_field("Nº do Documento", result['publicationNumber']))
+    right = [_html_field("Data de Publicação", result.get('_pub_fmt', 'N/A'))]
+    if result.get('filingDate'):
+        right.append(_html_field("Data do Pedido", result.get('_filing_fmt', 'N/A')))
+    if result.get('ipcCode'):
+        right.append(_html_field("Código IPC", result['ipcCode']))
+    parts.append(
+        '<div style="display:flex;gap:1rem">'
+        f'<div style="flex:1">{"<br>".join(left)}</div>'
+        f'<div style="flex:1">{"<br>".join(right)}</div>'
+        '</div>'
+    )
+
+    summary = result.get('snippet') or result.get('abstract', 'Não disponível')
+    if summary:
+        parts.append(f"**Resumo:**\n\n> {summary}")
+
+    url = result.get('link') or result.get('url')
+    if url:
+        parts.append(f"🔗 [Ver documento original]({url})")
+    return "\n\n".join(parts)
+
+
+# PDFs até este tamanho ficam no cache de `read_pdf_bytes`; maiores são lidos sob demanda
+PDF_CACHE_MAX_BYTES = 5 * 1024 * 1024
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def read_pdf_bytes(path: str, mtime: float) -> bytes:
+    """Lê um PDF do disco uma única vez por versão do arquivo (`mtime` entra na chave do cache)."""
+    return Path(path).read_bytes()
+
+
+def pdf_download_button(label: str, path: str, key: str = None, stat: os.stat_result = None):
+    """Oferece o download de um PDF sem lê-lo a cada rerun.
+
+    PDFs pequenos vêm do cache de `read_pdf_bytes` (`stat`, se já obtido pelo chamador,
+    evita um novo stat); os grandes só são lidos depois que o usuário pede o download, sem
+    ficar retidos no cache entre reruns. O diretório static/ não é servido publicamente:
+    ele também guarda os metadados dos jobs de PDF.
+    """
+    if stat is None:
+        stat = os.stat(path)
+    size = stat.st_size
+    download = dict(label=label, file_name=os.path.basename(path), mime="application/pdf", key=key)
+    if size <= PDF_CACHE_MAX_BYTES:
+        st.download_button(data=read_pdf_bytes(path, stat.st_mtime), **download)
+        return
+    ready_key = f"pdf_ready_{key or path}"
+    if not st.session_state.get(ready_key):
+        if not st.button(f"{label} ({size / (1024 * 1024):.1f} MB)", key=f"prepare_{key or path}"):
+            return
+        st.session_state[ready_key] = True
+    # Arquivo aberto só neste rerun: o Streamlit lê o handle, sem cópia extra em cache
+    with open(path, 'rb') as pdf_file:
+        if st.download_button(data=pdf_file, **download):
+            st.session_state.pop(ready_key, None)
+
+
+# Fim de frase seguido de espaços: vira quebra de parágrafo na exibição dos insights
+_INSIGHT_SPLIT = re.compile(r'\.\s+')
+
+
+def format_insights(insights: str) -> str:
+    """Formata os insights em um parágrafo por frase (markdown)."""
+    return _INSIGHT_SPLIT.sub('.\n\n', insights)
+
 
 # Refatoração GPT5
+# Campos de `results` usados pelo PDFGenerator (e pelos metadados do job). Os dados
+# classificados completos não entram no relatório e ficam fora do payload do PDF.
+PDF_RESULT_KEYS = (
+    'search_criteria', 'flow_id', 'success', 'data_collected', 'data_classified',
+    'total_categories', 'category_summary', 'insights', 'formatted_insights',
+    'analysis_results', 'llm_model',
+)
+
+
+def build_pdf_payload(results: Dict[str, Any], visualizations) -> Dict[str, Any]:
+    """Monta o payload compacto enviado ao gerador de PDF."""
+    payload = {key: results[key] for key in PDF_RESULT_KEYS if key in results}
+    payload['visualizations'] = visualizations
+    return payload
+
+
+# Caracteres com que um documento JSON pode começar
+_JSON_START_CHARS = frozenset('{["-0123456789tfn')
+
+
 def safe_json_loads(data, fallback):
     """Carrega JSON com segurança, aceita dict/list ou string JSON."""
-    if isinstance(data, str):
-        try:
-            return json.loads(data)
-        except Exception:
-            return fallback
-    return data if data else fallback
+    if not data:
+        return fallback
+    if not isinstance(data, (str, bytes)):
+        return data
+    text = data.lstrip()
+    if not text:
+        return fallback
+    # Descarta de imediato o que não pode ser JSON, sem passar pelo parser/exceção
+    first = chr(text[0]) if isinstance(text, bytes) else text[0]
+    if first not in _JSON_START_CHARS:
+        return fallback
+    try:
+        return json_utils.loads(text)
+    except ValueError:
+        # json.JSONDecodeError e orjson.JSONDecodeError são subclasses de ValueError
+        return fallback
 
 class StreamlitIPApp:
     """
@@ -46,43 +463,17 @@ class StreamlitIPApp:
     
     def setup_page_config(self):
         """Configura as propriedades básicas da página Streamlit."""
-        st.set_page_config(
-            page_title="Análise de Propriedade Intelectual",
-            page_icon="🔍",
-            layout="wide",
-            initial_sidebar_state="expanded"
-        )
+        st.set_page_config(**PAGE_CONFIG)
 
     def inject_custom_css(self):
         """Injeta o CSS customizado para a aplicação."""
-        st.markdown("""
-        <style>
-            /* Botões com largura total dentro das colunas */
-            div.stButton > button {
-                width: 100%;
-                height: 100%;
-            }
-            /* Card para o histórico */
-            .card {
-                background-color: #e6f3ff; /* Azul suave */
-                border: 1px solid #b8d8f5;
-                border-radius: 7px;
-                padding: 15px;
-                margin-bottom: 10px;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.12), 0 1px 2px rgba(0,0,0,0.24);
-            }
-            /* Divisor customizado */
-            hr.styled-divider {
-                border-top: 20px solid yellow;
-                border-radius: 5px;
-            }
-        </style>
-        """, unsafe_allow_html=True)
+        st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
     def initialize_services(self):
         """Inicializa o serviço de análise e o gerador de PDF."""
         try:
-            self.analysis_service = IPAnalysisService()
+            # Serviço compartilhado entre sessões, com pool de conexões próprio
+            self.analysis_service = _analysis_service()
             # Importa o gerador de PDF de forma segura (evita falha de import quando dependências não estão instaladas)
             try:
                 from tools.pdf_generator import PDFGenerator
@@ -133,20 +524,14 @@ class StreamlitIPApp:
         """Renderiza a barra lateral com os controles."""
         st.sidebar.header("🔧 Controles de Pesquisa")
         # Seletor de modelo LLM (override por execução). 'Env default' usa o LLM_MODEL do .env
-        llm_options = [
-            'Env default',
-            'gpt-5-nano',
-            'gpt-4o-mini',
-            'gpt-4o',
-            'gpt-4o-realtime-preview',
-            'gpt-4',
-            'gpt-3.5-turbo'
-        ]
         # Insere o valor atual no topo se não fizer parte das opções
         current = st.session_state.get('selected_llm_model') or 'Env default'
-        if current not in llm_options:
-            llm_options.insert(0, current)
-        chosen = st.sidebar.selectbox('Modelo LLM (override)', options=llm_options, index=llm_options.index(current))
+        idx = LLM_INDEX.get(current)
+        if idx is None:
+            options, idx = (current, *LLM_OPTIONS), 0
+        else:
+            options = LLM_OPTIONS
+        chosen = st.sidebar.selectbox('Modelo LLM (override)', options=options, index=idx)
         st.session_state.selected_llm_model = chosen
 
         with st.sidebar.form("search_form"):
@@ -159,12 +544,16 @@ class StreamlitIPApp:
         """Dispara a análise usando o IPAnalysisService e atualiza a tela."""
         st.session_state.is_processing = True
         st.session_state.analysis_results = None
+        # Figuras da análise anterior não são mais necessárias
+        st.session_state['_fig_cache'] = {}
         
         with st.spinner("🔄 Executando fluxo de análise completo (com persistência no banco de dados)..."):
             try:
                 # PASSO 1: REGISTRO - Cria a busca no DB e obtém o ID.
                 # O método start_analysis retorna um ID inteiro ou levanta uma exceção em caso de falha.
                 flow_id = self.analysis_service.start_analysis(search_criteria)
+                # Nova busca registrada: o histórico em cache fica desatualizado
+                clear_history_cache()
 
                 # PASSO 2: EXECUÇÃO - Executa o crewai-flow usando o ID.
                 results = self.analysis_service.execute_analysis(flow_id)
@@ -172,6 +561,11 @@ class StreamlitIPApp:
                     st.error(f"Falha ao executar a análise: {results['error']}")
                     st.session_state.is_processing = False
                     return
+                # Novos resultados persistidos: descarta os detalhes em cache
+                fetch_category_counts.clear()
+                fetch_query_info.clear()
+                fetch_category_results.clear()
+                fetch_results_table.clear()
 
                 # PASSO 3: APRESENTAÇÃO (Tradução dos resultados)
                 # O fluxo retorna os resultados das ferramentas como strings JSON.
@@ -194,8 +588,8 @@ class StreamlitIPApp:
                     'category_summary': category_summary,
                     'total_categories': len(category_summary),
                     'insights': insights,
-                    'formatted_insights': insights.replace('. ', '.\n\n'),
-                    'visualizations': results.get('visualizations', {}),
+                    'formatted_insights': format_insights(insights),
+                    'visualizations': normalize_visualizations(visualizations),
                     'success': True,
                     'flow_id': flow_id,
                     # Adiciona os dados já decodificados para uso em outras partes (PDF, detalhes)
@@ -269,6 +663,9 @@ class StreamlitIPApp:
         col3.metric("Visualizações", viz_count)
         col4.metric("Análises", analysis_count)
     
+    # Seções com widgets próprios rodam como fragmentos: clicar em seus botões reexecuta
+    # apenas o fragmento, sem reenviar os gráficos Plotly ao navegador.
+    @st.fragment
     def render_insights(self, results: Dict[str, Any]):
         st.subheader("💡 Insights e Conclusões")
         st.markdown(results.get('formatted_insights', 'Nenhum insight gerado.'))
@@ -290,7 +687,7 @@ class StreamlitIPApp:
                             insights = self.ip_agents.generate_insights_via_llm(analysis=analysis, classified=classified, model=model_param)
                             if insights:
                                 # Atualiza sessão e exibe
-                                formatted = insights.replace('. ', '.\n\n')
+                                formatted = format_insights(insights)
                                 st.success("Insights gerados com sucesso.")
                                 st.markdown(formatted)
                                 # Atualiza o estado para permitir exportação
@@ -301,9 +698,15 @@ class StreamlitIPApp:
                                 # Persiste um log curto no banco de dados
                                 try:
                                     if flow_id:
-                                        db = BuscapiDB()
-                                        db.insert_search_log(flow_id, f"LLM insights: {insights[:3000]}")
-                                        db.close()
+                                        logs = [(flow_id, f"LLM insights: {insights[:3000]}")]
+                                        # IPAgents é compartilhado entre sessões: o modelo usado é resolvido
+                                        # aqui (seleção da sessão ou LLM_MODEL), não lido do objeto
+                                        used_model = model_param if model_param is not None else self.ip_agents.current_llm_model()
+                                        if used_model:
+                                            logs.insert(0, (flow_id, f"LLM model: {used_model}"))
+                                        # Conexão compartilhada e um único INSERT para todos os logs
+                                        with shared_db() as db:
+                                            db.insert_search_logs(logs)
                                 except Exception as e:
                                     st.warning(f"Não foi possível persistir os insights no banco: {e}")
                             else:
@@ -314,6 +717,24 @@ class StreamlitIPApp:
             # Segurança: não impedirá a renderização caso algo falhe
             pass
 
+    def _get_figure(self, viz_name: str, viz_json, flow_id=None):
+        """Retorna a figura da visualização, construindo-a uma única vez por análise.
+
+        As figuras ficam em `st.session_state['_fig_cache']` por (flow_id, viz_name), de
+        modo que a renderização e a exportação para PDF reaproveitam o mesmo objeto.
+        """
+        cache = st.session_state.setdefault('_fig_cache', {})
+        key = (flow_id, viz_name)
+        fig = cache.get(key)
+        if fig is None:
+            if not isinstance(viz_json, (str, bytes)):
+                viz_json = json_utils.dumps_bytes(viz_json)
+            fig = build_figure_cached(viz_json)
+            if fig is not None:
+                cache[key] = fig
+        return fig
+
+    @st.fragment
     def render_visualizations(self, results: Dict[str, Any]):
         st.subheader("📊 Visualizações")
         # A chave 'visualizations' agora contém um dicionário com os JSONs dos gráficos
@@ -336,31 +757,7 @@ class StreamlitIPApp:
 
         for viz_name, viz_json in viz_data.items():
             try:
-                fig = None
-
-                # Caso: string JSON que representa uma figura Plotly
-                if isinstance(viz_json, str):
-                    try:
-                        fig = pio.from_json(viz_json)
-                    except Exception:
-                        # tentar carregar como dict
-                        parsed = json.loads(viz_json)
-                        if isinstance(parsed, dict):
-                            fig = go.Figure(parsed)
-                        elif isinstance(parsed, list):
-                            fig = go.Figure(data=parsed)
-
-                # Caso: já é um dict (pode ser figura completa ou dict de traces)
-                elif isinstance(viz_json, dict):
-                    try:
-                        fig = go.Figure(viz_json)
-                    except Exception:
-                        # fallback: se dict contém 'data'/'layout'
-                        fig = go.Figure(data=viz_json.get('data', []), layout=viz_json.get('layout', {}))
-
-                # Caso: lista de traces
-                elif isinstance(viz_json, list):
-                    fig = go.Figure(data=viz_json)
+                fig = self._get_figure(viz_name, viz_json, results.get('flow_id'))
 
                 # Se por algum motivo ainda não temos figura, falha explicitamente
                 if fig is None:
@@ -371,61 +768,17 @@ class StreamlitIPApp:
                 viz_label = viz_name if 'viz_name' in locals() else '<unknown>'
                 st.error(f"Erro ao renderizar visualização {viz_label}: {e}")
 
+    @st.fragment
     def render_export_options(self, results: Dict[str, Any]):
         """Renderiza o botão de exportação e chama o método de geração de PDF."""
         st.subheader("📄 Opções de Exportação")
         # Ao invés de bloquear a UI gerando o PDF na hora, enfileiramos um job e retornamos job_id
         if st.button("📄 Gerar Relatório PDF (background)", type="primary"):
             try:
-                # Gera um arquivo temporário com imagens localmente antes de enfileirar
-                # Reusa a lógica de criação de imagens (mesma que estava em generate_pdf_and_download)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                temp_image_dir = os.path.join("static", "temp_images")
-                os.makedirs(temp_image_dir, exist_ok=True)
-
-                image_paths = {}
-                viz_data = results.get('visualizations', {}) or {}
-                for viz_name, viz_json in viz_data.items():
-                    try:
-                        fig = None
-                        if isinstance(viz_json, str):
-                            try:
-                                fig = pio.from_json(viz_json)
-                            except Exception:
-                                parsed = json.loads(viz_json)
-                                if isinstance(parsed, dict):
-                                    fig = go.Figure(parsed)
-                                elif isinstance(parsed, list):
-                                    fig = go.Figure(data=parsed)
-                        elif isinstance(viz_json, dict):
-                            try:
-                                fig = go.Figure(viz_json)
-                            except Exception:
-                                fig = go.Figure(data=viz_json.get('data', []), layout=viz_json.get('layout', {}))
-                        elif isinstance(viz_json, list):
-                            fig = go.Figure(data=viz_json)
-
-                        if fig is None:
-                            continue
-
-                        img_path = os.path.join(temp_image_dir, f"{viz_name}_{timestamp}.png")
-                        try:
-                            fig.write_image(img_path, scale=2)
-                            image_paths[viz_name] = img_path
-                        except Exception as e:
-                            print(f"Erro ao gerar imagem para PDF '{viz_name}': {e}")
-                    except Exception as e:
-                        print(f"Erro ao processar visualização '{viz_name}' para PDF: {e}")
-
-                # Prepara o payload de results para o gerador de PDF
-                results_for_pdf = results.copy()
-                results_for_pdf['visualizations'] = image_paths
-
-                job_meta = enqueue_pdf_job(results_for_pdf, search_query_id=results.get('flow_id'))
-                st.success(f"PDF enfileirado. Job ID: {job_meta.get('job_id')}")
-                st.info("Use a seção 'Histórico / Detalhes' para checar o status e baixar quando pronto.")
+                self.generate_pdf_and_download(results)
             except Exception as e:
                 st.error(f"Erro ao enfileirar PDF: {e}")
+        self.render_pdf_job_status()
 
         # Pequena UI para checar um job_id diretamente
         with st.expander("🔎 Checar status do job PDF"):
@@ -438,171 +791,175 @@ class StreamlitIPApp:
                     st.json(meta)
                     if meta.get('status') == 'completed' and meta.get('output_path'):
                         try:
-                            with open(meta.get('output_path'), 'rb') as f:
-                                st.download_button(label='Baixar PDF gerado', data=f.read(), file_name=os.path.basename(meta.get('output_path')))
+                            pdf_download_button('Baixar PDF gerado', meta.get('output_path'))
                         except Exception as e:
                             st.error(f"Falha ao abrir arquivo para download: {e}")
 
-    def generate_pdf_and_download(self, results: Dict[str, Any]):
-        """Gera o PDF e fornece o botão de download."""
-        try:
-            with st.spinner("📄 Gerando relatório PDF..."):
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                pdf_filename = f"relatorio_buscapi_{timestamp}.pdf"
-                pdf_output_path = os.path.join("static", pdf_filename)
-                
-                # --- Lógica para recriar imagens para o PDF ---
-                image_paths = {}
-                viz_data = results.get('visualizations', {})
-                temp_image_dir = os.path.join("static", "temp_images")
-                os.makedirs(temp_image_dir, exist_ok=True)
-
-                for viz_name, viz_json in viz_data.items():
-                    try:
-                        # Reusar a mesma lógica de renderização para criar a figura
-                        fig = None
-                        if isinstance(viz_json, str):
-                            try:
-                                fig = pio.from_json(viz_json)
-                            except Exception:
-                                parsed = json.loads(viz_json)
-                                if isinstance(parsed, dict):
-                                    fig = go.Figure(parsed)
-                                elif isinstance(parsed, list):
-                                    fig = go.Figure(data=parsed)
-                        elif isinstance(viz_json, dict):
-                            try:
-                                fig = go.Figure(viz_json)
-                            except Exception:
-                                fig = go.Figure(data=viz_json.get('data', []), layout=viz_json.get('layout', {}))
-                        elif isinstance(viz_json, list):
-                            fig = go.Figure(data=viz_json)
-
-                        if fig is None:
-                            st.warning(f"Visualização {viz_name} não pôde ser convertida para Plotly.")
-                            continue
-
-                        # Exibe no Streamlit como pré-visualização no processo de geração do PDF
-                        st.plotly_chart(fig, use_container_width=True, key=f"pdf_viz_{viz_name}_{timestamp}")
+    def generate_pdf_and_download(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        """Enfileira a geração do PDF no worker de background e guarda o job na sessão.
+
+        A UI não fica bloqueada gerando imagens e o PDF: `render_pdf_job_status` mostra o
+        andamento e oferece o download quando o job termina.
+        """
+        # As visualizações seguem como JSON: o worker de PDF gera as imagens em background
+        results_for_pdf = build_pdf_payload(results, results.get('visualizations', {}) or {})
+        job_meta = enqueue_pdf_job(results_for_pdf, search_query_id=results.get('flow_id'))
+        st.session_state.pdf_job_id = job_meta.get('job_id')
+        return job_meta
+
+    def render_pdf_job_status(self):
+        """Mostra o status do último job de PDF desta sessão e o download quando pronto.
+
+        Só o job pendente é acompanhado por um fragmento com atualização periódica; o
+        estado final (download ou erro) é exibido sem polling.
+        """
+        job_id = st.session_state.get('pdf_job_id')
+        if not job_id:
+            return
+        meta = get_job_meta(job_id)
+        if meta.get('status') in ('completed', 'failed'):
+            self._render_pdf_job_result(job_id, meta)
+        else:
+            self._poll_pdf_job(job_id)
+
+    @st.fragment(run_every=PDF_STATUS_POLL_SECONDS)
+    def _poll_pdf_job(self, job_id: str):
+        """Reexecutado a cada `PDF_STATUS_POLL_SECONDS` enquanto o job não termina (status em memória no worker)."""
+        status = get_job_meta(job_id).get('status')
+        if status in ('completed', 'failed'):
+            # Rerun completo: o estado final passa a ser exibido fora deste fragmento
+            st.rerun()
+        st.info(f"📄 Gerando relatório PDF em background... (Job ID: {job_id}, status: {status})")
 
-                        try:
-                            img_path = os.path.join(temp_image_dir, f"{viz_name}_{timestamp}.png")
-                            fig.write_image(img_path, scale=2)
-                            image_paths[viz_name] = img_path
-                        except Exception as e:
-                            print(f"Erro ao gerar imagem para PDF '{viz_name}': {e}")
-                            # não interrompe o loop: continua com próximas visualizações
-                    except Exception as e:
-                        print(f"Erro ao processar visualização '{viz_name}' para PDF: {e}")
-                
-                # Atualiza o dicionário de resultados com os caminhos das imagens para o gerador de PDF
-                results_for_pdf = results.copy()
-                results_for_pdf['visualizations'] = image_paths
-                self.pdf_generator.generate_report(results_for_pdf, pdf_output_path)
-            
-            with open(pdf_output_path, "rb") as pdf_file:
-                st.download_button(
-                    label="Clique para baixar o PDF",
-                    data=pdf_file.read(),
-                    file_name=os.path.basename(pdf_output_path),
-                    mime="application/pdf"
-                )
-        except Exception as e:
-            st.error(f"❌ Erro ao gerar relatório PDF: {e}")
+    @st.fragment
+    def _render_pdf_job_result(self, job_id: str, meta: dict):
+        if meta.get('status') == 'completed' and meta.get('output_path'):
+            st.success(f"PDF pronto (Job ID: {job_id}).")
+            try:
+                pdf_download_button("Clique para baixar o PDF", meta['output_path'], key=f"pdf_{job_id}")
+            except Exception as e:
+                st.error(f"Falha ao abrir arquivo para download: {e}")
+        else:
+            st.error(f"❌ Erro ao gerar relatório PDF: {meta.get('error')}")
 
     def render_history_sidebar(self):
         """Renderiza controles específicos para a página de histórico."""
         st.sidebar.header("📋 Controles do Histórico")
         
         with st.sidebar.expander("🔍 Filtros", expanded=True):
-            st.date_input("Filtrar por data:", key='date_filter', help="Deixe em branco para ver todos os registros")
-            st.selectbox("Filtrar por status:", options=["Todos", "Concluído", "Em andamento", "Erro"], key='status_filter')
+            # Os filtros só são aplicados juntos no envio do formulário (um único rerun)
+            with st.form("history_filters", border=False):
+                st.date_input("Filtrar por data:", key='date_filter', help="Deixe em branco para ver todos os registros")
+                st.selectbox("Filtrar por status:", options=["Todos", "Concluído", "Em andamento", "Erro"], key='status_filter')
+                # Novos filtros voltam para a primeira página do histórico
+                st.form_submit_button("Aplicar filtros", on_click=lambda: st.session_state.pop('history_page', None))
         
         st.sidebar.markdown("### ⚡ Ações Rápidas")
         if st.sidebar.button("🔄 Atualizar Lista", help="Recarrega os dados do histórico"):
+            clear_history_cache()
             st.rerun()
         
         if st.sidebar.button("🗑️ Limpar Seleção", help="Remove a seleção atual"):
             if 'selected_query_id' in st.session_state:
                 del st.session_state.selected_query_id
+            st.session_state.pop('selected_query_row', None)
             if 'history_selector' in st.session_state:
                 del st.session_state.history_selector
             st.rerun()
         
-        try:
-            db = BuscapiDB()
-            all_queries = db.get_all_search_queries()
-            total_searches = len(all_queries) if all_queries else 0
-            try:
-                recent_searches = db.count_recent_searches(days=7) if hasattr(db, 'count_recent_searches') else 0
-            except:
-                recent_searches = 0
-            db.close()
-            
-            st.sidebar.markdown("### 📊 Estatísticas")
-            st.sidebar.metric("Total de Buscas", total_searches)
-            st.sidebar.metric("Últimos 7 dias", recent_searches)
-            
-        except Exception as e:
-            st.sidebar.error(f"Erro ao carregar estatísticas: {e}")
-        
+        with st.sidebar:
+            self.render_history_stats()
+
         st.sidebar.markdown("---")
         st.sidebar.markdown("**💡 Dicas:**")
         st.sidebar.markdown("• Clique em uma busca para ver detalhes")
         st.sidebar.markdown("• Use 'Executar Novamente' para repetir uma análise")
         st.sidebar.markdown("• Os resultados são salvos automaticamente")
 
+    @st.fragment(run_every=HISTORY_STATS_REFRESH_SECONDS)
+    def render_history_stats(self):
+        """Estatísticas do histórico, atualizadas periodicamente sem rerodar a página."""
+        try:
+            st.markdown("### 📊 Estatísticas")
+            if st.button("🔄 Atualizar estatísticas", key="refresh_history_stats"):
+                # Recalcula só o agregado e redesenha só este fragmento, não a página
+                load_history_stats.clear()
+                st.rerun(scope="fragment")
+            stats = load_history_stats()
+            st.metric("Total de Buscas", stats['total'])
+            st.metric("Últimos 7 dias", stats['recent'])
+
+        except Exception as e:
+            st.error(f"Erro ao carregar estatísticas: {e}")
+
     def render_history_page(self):
-        """Renderiza a página com o histórico de buscas em formato de cards."""
+        """Renderiza a página com o histórico de buscas em uma tabela com seleção de linha."""
         st.header("📜 Histórico de Buscas Registradas")
         st.info(f"Última atualização: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
 
         try:
-            db = BuscapiDB()
-            history_data = db.get_all_search_queries()
-            db.close()
-            
-            if not history_data:
-                st.info("Nenhum registro de busca encontrado.")
-                return
+            date_filter = st.session_state.get('date_filter')
+            status_filter = st.session_state.get('status_filter', "Todos")
+            total = count_history(date_filter, status_filter)
 
-            df = pd.DataFrame(history_data)
-
-            if 'date_filter' in st.session_state and st.session_state.date_filter is not None:
-                df['created_at_date'] = pd.to_datetime(df['created_at']).dt.date
-                if st.session_state.date_filter:
-                    df = df[df['created_at_date'] == st.session_state.date_filter]
-
-            if 'status_filter' in st.session_state and st.session_state.status_filter != "Todos":
-                df = df[df['status'] == st.session_state.status_filter]
-            
-            if df.empty:
-                st.warning("Nenhum registro encontrado com os filtros aplicados.")
+            if not total:
+                if date_filter or status_filter != "Todos":
+                    st.warning("Nenhum registro encontrado com os filtros aplicados.")
+                else:
+                    st.info("Nenhum registro de busca encontrado.")
                 return
 
-            for index, row in df.iloc[::-1].iterrows():
-                with st.container():
-                    st.markdown('<div class="card" >' , unsafe_allow_html=True)
-                    
-                    main_col, btn_col = st.columns([3, 1])
-                    
-                    with main_col:
-                        st.markdown(f"**Critério:** `{row['criteria']}`")
-                        st.caption(f"ID: {row['id']} | Data: {pd.to_datetime(row['created_at']).strftime('%d/%m/%Y %H:%M')} | Status: {row['status']}")
-                    
-                    with btn_col:
-                        btn1, btn2 = st.columns(2)
-                        with btn1:
-                            if st.button("👁️", key=f"details_{row['id']}", help="Ver Detalhes"):
-                                st.session_state.selected_query_id = row['id']
-                                st.rerun()
-                        with btn2:
-                            if st.button("🔄", key=f"rerun_{row['id']}", help="Executar Novamente"):
-                                st.session_state.current_search = row['criteria']
-                                st.session_state.page = "Análise Principal"
-                                st.rerun()
-                    
-                    st.markdown('</div>', unsafe_allow_html=True)
+            n_pages = -(-total // HISTORY_PAGE_SIZE)
+            page = min(st.session_state.get('history_page', 0), n_pages - 1)
+            view = load_history_view(date_filter, status_filter, page)
+            if n_pages > 1:
+                prev_col, info_col, next_col = st.columns([1, 2, 1])
+                with prev_col:
+                    if st.button("⬅️ Mais recentes", disabled=page == 0, key="history_prev"):
+                        st.session_state.history_page = page - 1
+                        st.rerun()
+                with info_col:
+                    st.caption(f"Página {page + 1} de {n_pages} ({total} buscas)")
+                with next_col:
+                    if st.button("Mais antigas ➡️", disabled=page + 1 >= n_pages, key="history_next"):
+                        st.session_state.history_page = page + 1
+                        st.rerun()
+
+            # Uma única tabela (em vez de um card com botões por linha); as ações ficam
+            # disponíveis apenas para a linha selecionada.
+            event = st.dataframe(
+                view,
+                key='history_selector',
+                on_select="rerun",
+                selection_mode="single-row",
+                hide_index=True,
+                use_container_width=True,
+                column_config=HISTORY_COLUMN_CONFIG,
+                column_order=list(HISTORY_COLUMN_CONFIG),
+            )
+
+            selected_rows = event.selection.rows if event else []
+            if selected_rows:
+                row = view.iloc[selected_rows[0]]
+                st.markdown('<div class="card" >' , unsafe_allow_html=True)
+                main_col, btn_col = st.columns([3, 1])
+                with main_col:
+                    st.markdown(f"**Critério:** `{row['criteria']}`")
+                    st.caption(f"ID: {row['id']} | Data: {row['created_at_str']} | Status: {row['status']}")
+                with btn_col:
+                    btn1, btn2 = st.columns(2)
+                    with btn1:
+                        if st.button("👁️", key="details_selected", help="Ver Detalhes"):
+                            st.session_state.selected_query_id = int(row['id'])
+                            # A linha já carregada evita reler a busca no banco na tela de detalhes
+                            st.session_state.selected_query_row = row.to_dict()
+                            st.rerun()
+                    with btn2:
+                        if st.button("🔄", key="rerun_selected", help="Executar Novamente"):
+                            st.session_state.current_search = row['criteria']
+                            st.session_state.page = "Análise Principal"
+                            st.rerun()
+                st.markdown('</div>', unsafe_allow_html=True)
 
         except Exception as e:
             st.error(f"❌ Erro ao buscar histórico: {e}")
@@ -625,130 +982,97 @@ class StreamlitIPApp:
             st.rerun()
             return
 
+        # Cada seção é um fragmento: expandir resultados não reconsulta os PDFs
+        self.render_details_results(query_id)
+        self.render_details_pdfs(query_id)
+
+    @st.fragment
+    def render_details_results(self, query_id: int):
+        """Renderiza os resultados estruturados de uma busca, agrupados por categoria."""
         try:
-            db = BuscapiDB()
-            query_info = db.get_search_query_by_id(query_id)
-            # NOTA: Este método agora deve buscar os dados da tabela 'search_result_structured'
-            # e retornar a coluna 'structured_json' como uma lista de dicionários.
-            structured_results = db.get_structured_results_by_query_id(query_id)
-            db.close()
+            # Linha vinda do histórico; o banco só é consultado em acessos diretos (ex: após uma nova análise)
+            query_info = st.session_state.get('selected_query_row')
+            if not query_info or query_info.get('id') != query_id:
+                query_info = fetch_query_info(query_id)
+            category_counts = fetch_category_counts(query_id)
 
             if query_info:
                 st.info(f"**Critério de Busca:** {query_info.get('criteria', 'N/A')}")
 
-            if not structured_results:
+            if not category_counts:
                 st.info("Nenhum resultado estruturado encontrado para esta busca.")
                 return
 
-            # Os dados já vêm processados do banco. Não é necessário reprocessar.
-            all_results = structured_results
-            if not all_results:
-                st.warning("Nenhum item de resultado pôde ser extraído dos dados brutos.")
+            st.write(f"**Resultados encontrados e classificados:** {sum(n for _, n in category_counts)}")
+
+            if st.toggle("Modo compacto (tabela)", key="details_compact"):
+                # O st.dataframe só desenha as linhas visíveis, qualquer que seja o total
+                st.dataframe(
+                    fetch_results_table(query_id),
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config=DETAILS_COLUMN_CONFIG,
+                )
                 return
 
-            st.write(f"**Resultados encontrados e classificados:** {len(all_results)}")
-
-            results_by_category = {}
-            for result in all_results:
-                category = result.get('category', 'Sem Categoria')
-                if category not in results_by_category:
-                    results_by_category[category] = []
-                results_by_category[category].append(result)
-
-            for category, results in results_by_category.items():
-                with st.expander(f"📂 {category} ({len(results)} resultados)", expanded=True):
-                    for i, result in enumerate(results):
-                        with st.container():
-                            title = result.get('title', 'Título não disponível')
-                            applicant = result.get('applicantName', 'Não informado')
-                            summary = result.get('snippet') or result.get('abstract', 'Não disponível')
-                            app_number = result.get('applicationNumber')
-                            pub_number = result.get('publicationNumber')
-                            source = result.get('source', 'Desconhecida')
-                            url = result.get('link') or result.get('url')
-                            ipc_code = result.get('ipcCode')
-                            filing_date = result.get('filingDate')
-                            pub_date = result.get('publicationDate') or result.get('date')
-
-                            def format_date(date_val):
-                                if not date_val: return 'N/A'
-                                try:
-                                    return pd.to_datetime(date_val).strftime('%d/%m/%Y')
-                                except (ValueError, TypeError):
-                                    return str(date_val)
-
-                            # Exibe as novas entidades extraídas
-                            organizations = result.get('extracted_organizations', [])
-                            persons = result.get('extracted_persons', [])
-
-                            if organizations:
-                                st.markdown(f"**🏢 Organizações Identificadas:** ` {', '.join(organizations)} `")
-                            if persons:
-                                st.markdown(f"**👤 Pessoas/Inventores Identificados:** ` {', '.join(persons)} `")
-
-                            st.markdown(f"**{i+1}. {title}**")
-                            st.markdown(f"**Fonte:** {source}")
-
-                            col1, col2 = st.columns(2)
-                            with col1:
-                                st.markdown(f"**Requerente:** {applicant}")
-                                if app_number: st.markdown(f"**Nº do Pedido:** {app_number}")
-                                if pub_number: st.markdown(f"**Nº do Documento:** {pub_number}")
-                            with col2:
-                                st.markdown(f"**Data de Publicação:** {format_date(pub_date)}")
-                                if filing_date: st.markdown(f"**Data do Pedido:** {format_date(filing_date)}")
-                                if ipc_code: st.markdown(f"**Código IPC:** {ipc_code}")
-                            
-                            if summary:
-                                st.markdown("**Resumo:**")
-                                st.markdown(f"> {summary}")
-                            
-                            if url:
-                                st.markdown(f"🔗 [Ver documento original]({url})")
-                            
-                            st.divider()
-
-            # --- Seção: Relatórios PDF gerados para esta busca ---
-            try:
-                st.subheader("📎 Relatórios PDF gerados")
-                pdf_jobs_dir = os.path.join("static", "pdf_jobs")
-                found = []
-                if os.path.isdir(pdf_jobs_dir):
-                    for fname in sorted(os.listdir(pdf_jobs_dir), reverse=True):
-                        if not fname.lower().endswith('.json'):
-                            continue
-                        fpath = os.path.join(pdf_jobs_dir, fname)
-                        try:
-                            with open(fpath, 'r', encoding='utf-8') as f:
-                                meta = json.load(f)
-                            if meta.get('search_query_id') == query_id:
-                                found.append(meta)
-                        except Exception:
-                            continue
-
-                if not found:
-                    st.info("Nenhum relatório PDF encontrado para esta busca.")
-                else:
-                    for meta in found:
-                        st.markdown(f"**Job ID:** `{meta.get('job_id')}` — Status: **{meta.get('status')}**")
-                        op = meta.get('output_path')
-                        if meta.get('status') == 'completed' and op and os.path.exists(op):
-                            try:
-                                with open(op, 'rb') as f:
-                                    st.download_button(label=f"Baixar {os.path.basename(op)}", data=f.read(), file_name=os.path.basename(op))
-                            except Exception as e:
-                                st.error(f"Falha ao abrir PDF para download: {e}")
-                        else:
-                            if op:
-                                st.write(f"Caminho do arquivo: {op}")
-                            st.write("Aguardando geração ou falha registrada.")
-            except Exception as e:
-                st.error(f"Erro ao recuperar relatórios PDF: {e}")
+            for category, count in category_counts:
+                # Só os primeiros blocos de cada categoria são lidos; o restante sob demanda
+                shown_key = f"details_shown_{query_id}_{category}"
+                shown = min(st.session_state.get(shown_key, DETAILS_CATEGORY_STEP), count)
+                results = []
+                for offset in range(0, shown, DETAILS_CATEGORY_STEP):
+                    results.extend(fetch_category_results(query_id, category, offset))
+
+                with st.expander(f"📂 {category} ({count} resultados)", expanded=True):
+                    # Um único elemento markdown por categoria em vez de ~10 por resultado
+                    st.markdown(
+                        "\n\n---\n\n".join(
+                            result_markdown(i, result) for i, result in enumerate(results)
+                        ) + "\n\n---",
+                        unsafe_allow_html=True,
+                    )
+
+                    if count > shown:
+                        if st.button(f"Mostrar mais {min(DETAILS_CATEGORY_STEP, count - shown)}", key=f"more_{shown_key}"):
+                            st.session_state[shown_key] = shown + DETAILS_CATEGORY_STEP
+                            st.rerun(scope="fragment")
 
         except Exception as e:
             st.error(f"❌ Erro ao buscar detalhes da busca: {e}")
             st.code(traceback.format_exc())
 
+    @st.fragment
+    def render_details_pdfs(self, query_id: int):
+        """Renderiza os relatórios PDF gerados para uma busca."""
+        try:
+            st.subheader("📎 Relatórios PDF gerados")
+            # Consulta o índice de jobs por busca em vez de abrir todos os metadados
+            found = list_jobs_for_query(query_id)
+
+            if not found:
+                st.info("Nenhum relatório PDF encontrado para esta busca.")
+            else:
+                for meta in found:
+                    st.markdown(f"**Job ID:** `{meta.get('job_id')}` — Status: **{meta.get('status')}**")
+                    op = meta.get('output_path')
+                    # Um único stat confirma que o arquivo existe e fornece tamanho e mtime ao download
+                    try:
+                        op_stat = os.stat(op) if meta.get('status') == 'completed' and op else None
+                    except OSError:
+                        op_stat = None
+                    if op_stat is not None:
+                        try:
+                            pdf_download_button(f"Baixar {os.path.basename(op)}", op, key=f"pdf_{meta.get('job_id')}",
+                                                stat=op_stat)
+                        except Exception as e:
+                            st.error(f"Falha ao abrir PDF para download: {e}")
+                    else:
+                        if op:
+                            st.write(f"Caminho do arquivo: {op}")
+                        st.write("Aguardando geração ou falha registrada.")
+        except Exception as e:
+            st.error(f"Erro ao recuperar relatórios PDF: {e}")
+
     def run(self):
         """Executa a renderização da UI."""
         self.inject_custom_css()
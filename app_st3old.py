@@ -1,19 +1,26 @@
 import streamlit as st
 import pandas as pd
 import os
-import sys
 from typing import Dict, Any
 from datetime import datetime
+from functools import lru_cache
 from database.persist_dados import BuscapiDB
 import plotly.express as px
 import traceback
 
-# Adiciona o diretório raiz do projeto ao path para garantir que as importações funcionem
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
 from tools_processor import CustomToolsProcessor
 from tools.pdf_generator import PDFGenerator
 
+@lru_cache(maxsize=4096)
+def format_date(date_val) -> str:
+    """Formata uma data ISO-8601 como dd/mm/aaaa; memoizada, pois as mesmas datas se repetem a cada rerun."""
+    if not date_val: return 'N/A'
+    try:
+        return datetime.fromisoformat(str(date_val)).strftime('%d/%m/%Y')
+    except ValueError:
+        return str(date_val)
+
+
 class StreamlitIPApp:
     """
     Aplicação Streamlit (UI) que consome dados do CustomToolsProcessor
@@ -245,28 +252,29 @@ class StreamlitIPApp:
             }
             
             display_df = df.head(20) if len(df) > 20 else df
-            st.dataframe(display_df, column_config=column_config, use_container_width=True, hide_index=True)
+            # Seleção nativa de linha da tabela: sem lista de rótulos nem parsing do ID
+            event = st.dataframe(display_df, column_config=column_config, use_container_width=True, hide_index=True,
+                                 key="history_selector", on_select="rerun", selection_mode="single-row")
             
             st.markdown("---")
             st.subheader("🔍 Ver Detalhes de uma Busca")
             
-            if not df.empty:
-                options = [f"ID {row['id']} - {row['criteria'][:50]}... ({pd.to_datetime(row['created_at']).strftime('%d/%m')})" for _, row in df.iterrows()]
-                selected_option = st.selectbox("Selecione uma busca:", options=["Selecione uma busca..."] + options, key="history_selector")
+            if event.selection.rows:
+                selected_row = display_df.iloc[event.selection.rows[0]]
+                selected_id = int(selected_row['id'])
+                st.caption(f"Busca selecionada: ID {selected_id} - {selected_row['criteria']}")
                 
-                if selected_option != "Selecione uma busca...":
-                    selected_id = int(selected_option.split(" - ")[0].replace("ID ", ""))
-                    
-                    col1, col2, col3, col4 = st.columns([1, 1, 1, 2])
-                    if col1.button("👁️ Ver Detalhes", type="primary"):
-                        st.session_state.selected_query_id = selected_id
-                        st.rerun()
-                    
-                    if col2.button("🔄 Executar Novamente", type="primary"):
-                        selected_row = df[df['id'] == selected_id].iloc[0]
-                        st.session_state.current_search = selected_row['criteria']
-                        st.session_state.page = "Análise Principal"
-                        st.rerun()
+                col1, col2, col3, col4 = st.columns([1, 1, 1, 2])
+                if col1.button("👁️ Ver Detalhes", type="primary"):
+                    st.session_state.selected_query_id = selected_id
+                    st.rerun()
+                
+                if col2.button("🔄 Executar Novamente", type="primary"):
+                    st.session_state.current_search = selected_row['criteria']
+                    st.session_state.page = "Análise Principal"
+                    st.rerun()
+            else:
+                st.info("Selecione uma busca na tabela acima.")
 
         except Exception as e:
             st.error(f"❌ Erro ao buscar histórico: {e}")
@@ -404,13 +412,6 @@ class StreamlitIPApp:
                             url = result.get('link') or result.get('url')
                             ipc_code = result.get('ipcCode')
 
-                            def format_date(date_val):
-                                if not date_val: return 'N/A'
-                                try:
-                                    return pd.to_datetime(date_val).strftime('%d/%m/%Y')
-                                except (ValueError, TypeError):
-                                    return str(date_val)
-
                             st.markdown(f"**{i+1}. {title}**")
                             st.markdown(f"**Fonte:** {source}")
 
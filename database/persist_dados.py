@@ -1,26 +1,130 @@
 
 import hashlib
-import json
+import threading
 import psycopg2
-from psycopg2.extras import Json
+from psycopg2 import errors as pg_errors
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import Json, execute_values, register_default_json, register_default_jsonb
 from datetime import datetime
 
+from tools import json_utils
+
+
+def create_connection_pool(minconn: int = 1, maxconn: int = 8, dbname="buscapi_bd", user="postgres",
+                           password="givas2025", host='localhost', port=5432) -> ThreadedConnectionPool:
+    """Cria um pool de conexões (seguro entre threads) para uso com `BuscapiDB(conn=...)`."""
+    return ThreadedConnectionPool(
+        minconn, maxconn,
+        dbname=dbname,
+        user=user,
+        password=password,
+        host=host,
+        port=port
+    )
+
+
+# Migração idempotente de bancos criados antes da deduplicação por item_hash (ver
+# script_table.sql). Roda no máximo uma vez por processo, na primeira conexão aberta,
+# e só quando algum dos índices abaixo ainda não existe.
+_SCHEMA_INDEXES = ('search_result_raw_query_hash_idx', 'search_query_created_at_idx',
+                   'search_query_status_created_at_idx')
+_SCHEMA_MIGRATION = """
+    SELECT pg_advisory_xact_lock(hashtext('buscapi_schema_migration'));
+    ALTER TABLE search_result_raw ADD COLUMN IF NOT EXISTS item_hash CHAR(64);
+    -- Duplicatas já gravadas: mantém o hash só na linha mais antiga (as demais continuam
+    -- referenciadas por search_result_structured e não podem ser apagadas)
+    UPDATE search_result_raw r SET item_hash = NULL
+        FROM search_result_raw d
+        WHERE r.search_query_id = d.search_query_id AND r.item_hash = d.item_hash AND r.id > d.id;
+    -- Backfill a partir do `_hash` gravado no JSON: só a linha mais antiga de cada
+    -- (search_query_id, hash) e só se o hash ainda não estiver em uso nessa busca
+    WITH first_rows AS (
+        SELECT DISTINCT ON (search_query_id, raw_json->>'_hash')
+               id, search_query_id, raw_json->>'_hash' AS item_hash
+        FROM search_result_raw
+        WHERE raw_json ? '_hash'
+        ORDER BY search_query_id, raw_json->>'_hash', id
+    )
+    UPDATE search_result_raw r SET item_hash = f.item_hash
+        FROM first_rows f
+        WHERE r.id = f.id AND r.item_hash IS NULL
+          AND NOT EXISTS (SELECT 1 FROM search_result_raw t
+                          WHERE t.search_query_id = f.search_query_id AND t.item_hash = f.item_hash);
+    CREATE UNIQUE INDEX IF NOT EXISTS search_result_raw_query_hash_idx
+        ON search_result_raw (search_query_id, item_hash);
+    CREATE INDEX IF NOT EXISTS search_query_created_at_idx ON search_query (created_at DESC);
+    CREATE INDEX IF NOT EXISTS search_query_status_created_at_idx ON search_query (status, created_at DESC);
+"""
+_schema_checked = False
+_schema_lock = threading.Lock()
+
+# Erros do ON CONFLICT (search_query_id, item_hash) quando a migração não pôde rodar
+# (ex: usuário sem permissão de ALTER): índice único ou coluna ausentes
+_NO_DEDUP_ERRORS = (pg_errors.InvalidColumnReference, pg_errors.UndefinedColumn)
+
+
+def ensure_schema(conn):
+    """Aplica `_SCHEMA_MIGRATION` em uma transação, no máximo uma vez por processo.
+
+    Com os índices já criados a migração é pulada (sem o ALTER TABLE e seu lock). Falhas
+    são apenas registradas e não são retentadas a cada conexão: os INSERTs de resultados
+    brutos recorrem a um INSERT simples (sem deduplicação) enquanto o índice único não existir.
+    """
+    global _schema_checked
+    if _schema_checked:
+        return
+    with _schema_lock:
+        if _schema_checked:
+            return
+        _schema_checked = True
+        autocommit = conn.autocommit
+        conn.autocommit = False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT bool_and(to_regclass(name) IS NOT NULL) FROM unnest(%s::text[]) AS name",
+                            (list(_SCHEMA_INDEXES),))
+                if not cur.fetchone()[0]:
+                    cur.execute(_SCHEMA_MIGRATION)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Aviso: migração do esquema não aplicada (resultados brutos sem deduplicação): {e}")
+        finally:
+            conn.autocommit = autocommit
+
+
+def _item_hash(raw_data: dict) -> str:
+    """Hash (sha256) do conteúdo de um resultado bruto, usado na deduplicação.
+
+    O JSON canônico (chaves ordenadas) já sai em bytes do orjson e é passado inteiro
+    ao hashlib numa única chamada, o que permite ao OpenSSL usar as instruções SHA da CPU.
+    """
+    return hashlib.sha256(json_utils.dumps_bytes(raw_data, sort_keys=True)).hexdigest()
+
 
 class BuscapiDB:
-    def __init__(self, dbname="buscapi_bd", user="postgres", password="givas2025", host='localhost', port=5432):
-        self.conn = psycopg2.connect(
+    def __init__(self, dbname="buscapi_bd", user="postgres", password="givas2025", host='localhost', port=5432,
+                 conn=None):
+        # Com `conn` (ex: emprestada de um pool), a conexão é reaproveitada e não é fechada em close()
+        self._owns_conn = conn is None
+        self.conn = conn if conn is not None else psycopg2.connect(
             dbname=dbname,
             user=user,
             password=password,
             host=host,
             port=port
         )
+        ensure_schema(self.conn)
         self.conn.autocommit = True
+        # Colunas json/jsonb (ex: structured_json) decodificadas com orjson
+        register_default_json(self.conn, loads=json_utils.loads)
+        register_default_jsonb(self.conn, loads=json_utils.loads)
         self.cur = self.conn.cursor()
 
     def close(self):
         self.cur.close()
-        self.conn.close()
+        if self._owns_conn:
+            self.conn.close()
 
     def insert_search_query(self, criteria: str, status: str='pending', user_id: int = None) -> int:
         """Insere um registro na tabela search_query e retorna o id criado."""
@@ -34,43 +138,87 @@ class BuscapiDB:
         return search_query_id
 
     def insert_search_result_raw(self, search_query_id: int, source: str, raw_data: dict) -> int:
+        """Insere um resultado bruto, sem duplicar itens iguais da mesma busca.
+
+        A deduplicação usa a coluna `item_hash` (índice único com search_query_id): um
+        único INSERT ... ON CONFLICT devolve o id novo ou o do item já existente.
+        """
         try:
             # 1. Calcular hash único do item
-            item_hash = hashlib.sha256(
-                json.dumps(raw_data, sort_keys=True, ensure_ascii=False).encode("utf-8")
-            ).hexdigest()
-
-            # 2. Incluir hash dentro do raw_data
-            raw_data["_hash"] = item_hash
-            raw_json = json.dumps(raw_data, ensure_ascii=False)
-
-            cursor = self.conn.cursor()
-
-            # 3. Checar se já existe (search_query_id + hash)
-            cursor.execute("""
-                SELECT id FROM search_result_raw
-                WHERE search_query_id = %s
-                AND raw_json::jsonb @> %s::jsonb
-            """, (search_query_id, json.dumps({"_hash": item_hash})))
-
-            existing = cursor.fetchone()
-            if existing:
-                return existing[0]  # retorna id existente
-
-            # 4. Inserir novo se não houver duplicado
-            cursor.execute("""
-                INSERT INTO search_result_raw (search_query_id, source, raw_json)
-                VALUES (%s, %s, %s)
-                RETURNING id
-            """, (search_query_id, source, raw_json))
-            self.conn.commit()
-            return cursor.fetchone()[0]
+            item_hash = _item_hash(raw_data)
+
+            # 2. Incluir hash no JSON gravado (sem alterar o dict do chamador)
+            raw_json = json_utils.dumps({**raw_data, "_hash": item_hash})
+
+            # 3. Inserir, ou apenas obter o id se (search_query_id, item_hash) já existir
+            try:
+                self.cur.execute("""
+                    INSERT INTO search_result_raw (search_query_id, source, raw_json, item_hash)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (search_query_id, item_hash) DO UPDATE SET item_hash = EXCLUDED.item_hash
+                    RETURNING id
+                """, (search_query_id, source, raw_json, item_hash))
+            except _NO_DEDUP_ERRORS:
+                # Banco sem a migração do item_hash: grava sem deduplicar
+                self.cur.execute("""
+                    INSERT INTO search_result_raw (search_query_id, source, raw_json)
+                    VALUES (%s, %s, %s) RETURNING id
+                """, (search_query_id, source, raw_json))
+            return self.cur.fetchone()[0]
 
         except Exception as e:
             print(f"Erro ao inserir resultado bruto: {e}")
             self.conn.rollback()
             return -1
 
+    def insert_search_results_raw_bulk(self, search_query_id: int, source: str, items: list) -> list:
+        """Insere vários resultados brutos de uma fonte em um único INSERT.
+
+        Mesma deduplicação de `insert_search_result_raw`. Retorna os ids na ordem de
+        `items` (itens repetidos recebem o mesmo id); em caso de erro, todos recebem -1.
+        """
+        if not items:
+            return []
+        try:
+            hashes = [_item_hash(raw_data) for raw_data in items]
+            # Um mesmo hash não pode aparecer duas vezes no ON CONFLICT DO UPDATE
+            unique = {}
+            for item_hash, raw_data in zip(hashes, items):
+                if item_hash not in unique:
+                    unique[item_hash] = (search_query_id, source,
+                                         json_utils.dumps({**raw_data, "_hash": item_hash}), item_hash)
+            try:
+                rows = execute_values(
+                    self.cur,
+                    """
+                    INSERT INTO search_result_raw (search_query_id, source, raw_json, item_hash)
+                    VALUES %s
+                    ON CONFLICT (search_query_id, item_hash) DO UPDATE SET item_hash = EXCLUDED.item_hash
+                    RETURNING item_hash, id
+                    """,
+                    list(unique.values()),
+                    page_size=500,
+                    fetch=True,
+                )
+            except _NO_DEDUP_ERRORS:
+                # Banco sem a migração do item_hash: grava sem deduplicar no banco (o lote já
+                # vem sem repetições); os ids voltam na ordem das linhas do VALUES
+                returned = execute_values(
+                    self.cur,
+                    "INSERT INTO search_result_raw (search_query_id, source, raw_json) VALUES %s RETURNING id",
+                    [row[:3] for row in unique.values()],
+                    page_size=500,
+                    fetch=True,
+                )
+                rows = [(item_hash, row[0]) for item_hash, row in zip(unique, returned)]
+            ids = dict(rows)
+            return [ids[item_hash] for item_hash in hashes]
+
+        except Exception as e:
+            print(f"Erro ao inserir resultados brutos: {e}")
+            self.conn.rollback()
+            return [-1] * len(items)
+
     def insert_search_result_structured(self, search_result_raw_id: int, category: str, title: str,
                                         date_found: datetime.date = None, applicant: str = None,
                                         summary: str = None, structured_json: dict = None) -> int:
@@ -86,6 +234,27 @@ class BuscapiDB:
         result_structured_id = self.cur.fetchone()[0]
         return result_structured_id
 
+    def insert_search_results_structured_bulk(self, rows: list) -> int:
+        """Insere vários resultados estruturados em um único INSERT.
+
+        `rows` é uma lista de tuplas na ordem dos argumentos de `insert_search_result_structured`:
+        (search_result_raw_id, category, title, date_found, applicant, summary, structured_json).
+        Retorna a quantidade de linhas inseridas.
+        """
+        if not rows:
+            return 0
+        execute_values(
+            self.cur,
+            """
+            INSERT INTO search_result_structured
+            (search_result_raw_id, category, title, date_found, applicant, summary, structured_json)
+            VALUES %s
+            """,
+            [row[:6] + (Json(row[6], dumps=json_utils.dumps) if row[6] else None,) for row in rows],
+            page_size=500,
+        )
+        return len(rows)
+
     def insert_search_log(self, search_query_id: int, log_msg: str) -> int:
         """Insere uma mensagem de log associada à uma busca."""
         query = """
@@ -97,6 +266,23 @@ class BuscapiDB:
         log_id = self.cur.fetchone()[0]
         return log_id
 
+    def insert_search_logs(self, entries: list) -> int:
+        """Insere várias mensagens de log de uma vez.
+
+        `entries` é uma lista de tuplas (search_query_id, log_msg) ou (search_query_id, log_msg,
+        log_time), para logs acumulados antes da gravação; sem log_time, usa o horário atual.
+        Todas são gravadas em um único INSERT com múltiplas linhas. Retorna a quantidade inserida.
+        """
+        if not entries:
+            return 0
+        now = datetime.now()
+        execute_values(
+            self.cur,
+            "INSERT INTO search_log (search_query_id, log_msg, log_time) VALUES %s",
+            [entry if len(entry) == 3 else (*entry, now) for entry in entries],
+        )
+        return len(entries)
+
     def update_search_query_status(self, search_query_id: int, new_status: str):
         """Atualiza o status da busca."""
         query = "UPDATE search_query SET status=%s WHERE id=%s;"
@@ -110,18 +296,67 @@ class BuscapiDB:
         result = self.cur.fetchone()
         return result[0] if result else None
 
-    def get_structured_results_by_query_id(self, search_query_id: int) -> list:
-        """Busca todos os resultados estruturados para um search_query_id, retornando apenas o JSON."""
-        query = """
-            SELECT s.structured_json
+    def get_structured_results_by_query_id(self, search_query_id: int, limit: int = None, offset: int = 0,
+                                           fields: tuple = None, category: str = None) -> list:
+        """Busca os resultados estruturados de um search_query_id, retornando apenas o JSON.
+
+        Com `limit`, retorna somente a página [offset, offset + limit) em ordem de inserção.
+        Com `fields`, o banco devolve só essas chaves de cada JSON (as ausentes são omitidas).
+        Com `category`, filtra pela chave 'category' do JSON (ver `get_category_counts`).
+        """
+        params = ()
+        if fields:
+            pairs = ", ".join("%s, s.structured_json->%s" for _ in fields)
+            select = f"jsonb_strip_nulls(jsonb_build_object({pairs}))"
+            for field in fields:
+                params += (field, field)
+        else:
+            select = "s.structured_json"
+        query = f"""
+            SELECT {select}
             FROM search_result_structured s
             JOIN search_result_raw r ON s.search_result_raw_id = r.id
-            WHERE r.search_query_id = %s;
+            WHERE r.search_query_id = %s AND s.structured_json IS NOT NULL
         """
-        self.cur.execute(query, (search_query_id,))
+        params += (search_query_id,)
+        if category is not None:
+            query += " AND COALESCE(s.structured_json->>'category', 'Sem Categoria') = %s"
+            params += (category,)
+        if limit is not None:
+            query += " ORDER BY s.id LIMIT %s OFFSET %s"
+            params += (limit, offset)
+        self.cur.execute(query, params)
         results = [row[0] for row in self.cur.fetchall() if row and row[0]]
         return results
 
+    def count_structured_results_by_query_id(self, search_query_id: int) -> int:
+        """Conta os resultados estruturados (com JSON) de um search_query_id."""
+        query = """
+            SELECT COUNT(*)
+            FROM search_result_structured s
+            JOIN search_result_raw r ON s.search_result_raw_id = r.id
+            WHERE r.search_query_id = %s AND s.structured_json IS NOT NULL;
+        """
+        self.cur.execute(query, (search_query_id,))
+        return self.cur.fetchone()[0]
+
+    def get_category_counts(self, search_query_id: int) -> list:
+        """Conta os resultados estruturados por categoria, da maior para a menor.
+
+        Retorna uma lista de tuplas (categoria, quantidade); resultados sem a chave
+        'category' no JSON entram como 'Sem Categoria'.
+        """
+        query = """
+            SELECT COALESCE(s.structured_json->>'category', 'Sem Categoria') AS category, COUNT(*)
+            FROM search_result_structured s
+            JOIN search_result_raw r ON s.search_result_raw_id = r.id
+            WHERE r.search_query_id = %s AND s.structured_json IS NOT NULL
+            GROUP BY 1
+            ORDER BY 2 DESC, 1;
+        """
+        self.cur.execute(query, (search_query_id,))
+        return self.cur.fetchall()
+
     def get_search_query_by_id(self, query_id: int) -> dict:
         """Busca uma search query pelo seu ID."""
         query = "SELECT id, criteria, created_at, status FROM search_query WHERE id = %s;"
@@ -132,6 +367,53 @@ class BuscapiDB:
             return dict(zip(columns, result))
         return None
     
+    @staticmethod
+    def _search_query_filters(date=None, status: str = None) -> tuple:
+        """Monta o WHERE (e parâmetros) dos filtros opcionais do histórico."""
+        clauses, params = [], []
+        if date is not None:
+            # Intervalo [date, date + 1 dia) em vez de created_at::date, para usar o índice
+            clauses.append("created_at >= %s AND created_at < %s::date + 1")
+            params += [date, date]
+        if status is not None:
+            clauses.append("status = %s")
+            params.append(status)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def get_search_queries(self, date=None, status: str = None, limit: int = None, offset: int = 0) -> list:
+        """Busca registros de search_query filtrados por data/status, dos mais recentes aos mais antigos.
+
+        Filtros None são ignorados; com `limit`, retorna só a página [offset, offset + limit).
+        """
+        where, params = self._search_query_filters(date, status)
+        query = f"SELECT id, criteria, created_at, status FROM search_query {where} ORDER BY created_at DESC"
+        if limit is not None:
+            query += " LIMIT %s OFFSET %s"
+            params += [limit, offset]
+        self.cur.execute(query, params)
+        columns = [desc[0] for desc in self.cur.description]
+        return [dict(zip(columns, row)) for row in self.cur.fetchall()]
+
+    def count_search_queries(self, date=None, status: str = None) -> int:
+        """Conta os registros de search_query com os mesmos filtros de `get_search_queries`."""
+        where, params = self._search_query_filters(date, status)
+        self.cur.execute(f"SELECT COUNT(*) FROM search_query {where}", params)
+        return self.cur.fetchone()[0]
+
+    def get_history_stats(self, recent_days: int = 7) -> dict:
+        """Total de buscas e quantas foram feitas nos últimos `recent_days` dias, numa única consulta."""
+        self.cur.execute(
+            """
+            SELECT count(*) AS total,
+                   count(*) FILTER (WHERE created_at >= now() - make_interval(days => %s)) AS recent
+            FROM search_query
+            """,
+            (recent_days,),
+        )
+        total, recent = self.cur.fetchone()
+        return {'total': total, 'recent': recent}
+
     def get_all_search_queries(self) -> list:
         """Busca todos os registros da tabela search_query."""
         query = "SELECT id, criteria, created_at, status FROM search_query ORDER BY created_at DESC;"
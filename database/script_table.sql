@@ -7,15 +7,23 @@ CREATE TABLE search_query (
   user_id INTEGER
 );
 
+-- Histórico: filtros por status/data e ordenação por data (get_search_queries)
+CREATE INDEX search_query_created_at_idx ON search_query (created_at DESC);
+CREATE INDEX search_query_status_created_at_idx ON search_query (status, created_at DESC);
+
 -- Resultados brutos das buscas
 CREATE TABLE search_result_raw (
   id SERIAL PRIMARY KEY,
   search_query_id INTEGER NOT NULL REFERENCES search_query(id) ON DELETE CASCADE,
   source VARCHAR(50) NOT NULL,
   raw_json JSONB,
+  item_hash CHAR(64),
   collected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Deduplicação de itens por busca (INSERT ... ON CONFLICT em insert_search_result_raw)
+CREATE UNIQUE INDEX search_result_raw_query_hash_idx ON search_result_raw (search_query_id, item_hash);
+
 -- Resultados estruturados/processados
 CREATE TABLE search_result_structured (
   id SERIAL PRIMARY KEY,
@@ -35,3 +43,6 @@ CREATE TABLE search_log (
   log_msg TEXT,
   log_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+
+-- Bancos existentes são migrados automaticamente (coluna item_hash, backfill a partir do
+-- '_hash' do JSON, duplicatas e índices) por ensure_schema() em database/persist_dados.py
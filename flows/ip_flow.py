@@ -1,8 +1,12 @@
 from crewai.flow.flow import Flow, listen, start
 from pydantic import BaseModel
 from typing import Dict, Any, Optional
-import json
+import asyncio
+import threading
+from datetime import datetime
 import traceback
+from contextlib import contextmanager
+from functools import lru_cache
 
 from agents.ip_agents import IPAgents
 from tools.custom_tools import (
@@ -14,6 +18,24 @@ from tools.custom_tools import (
 from database.persist_dados import BuscapiDB
 from tasks.ip_tasks import IPTaskManager
 from tasks.pdf_worker import enqueue_pdf_job
+from tools import json_utils
+
+# Tempo máximo (s) de cada tarefa paralela de `gerar_visualizacoes`. A thread que estoura o
+# prazo não é interrompida, apenas deixa de ser aguardada pelo fluxo.
+VISUALIZATION_TIMEOUT_SECONDS = 120
+INSIGHTS_TIMEOUT_SECONDS = 120
+
+
+@lru_cache(maxsize=1)
+def _shared_agents() -> IPAgents:
+    # Agentes (modelos pydantic com LLM/ferramentas) construídos uma vez por processo
+    return IPAgents()
+
+
+@lru_cache(maxsize=1)
+def _shared_task_manager() -> IPTaskManager:
+    return IPTaskManager(_shared_agents())
+
 
 # 1. Definir o Estado do Fluxo
 class PropriedadeIntelectualState(BaseModel):
@@ -26,6 +48,7 @@ class PropriedadeIntelectualState(BaseModel):
     classified_data_json: Optional[str] = None
     analysis_results_json: Optional[str] = None
     visualizations_json: Optional[str] = None
+    insights: Optional[str] = None
     
     # Para o relatório final
     final_report: Dict[str, Any] = {}
@@ -35,21 +58,59 @@ class PropriedadeIntelectualState(BaseModel):
 class PropriedadeIntelectualFlow(Flow[PropriedadeIntelectualState]):
     """Fluxo principal para análise de propriedade intelectual usando crewai-flow."""
 
-    def __init__(self, **kwargs):
+    def __init__(self, db: BuscapiDB = None, **kwargs):
         super().__init__(**kwargs)
-        # Inicializa os agentes uma vez para todo o fluxo
-        self.agents = IPAgents()
-        # Inicializa o gerenciador de tarefas que encapsula a criação de Tasks/Agents
-        self.task_manager = IPTaskManager(self.agents)
-        self.db = BuscapiDB() # Manter uma conexão aberta durante o fluxo
+        # Agentes e gerenciador de tarefas são compartilhados por todos os fluxos do processo
+        self.agents = _shared_agents()
+        self.task_manager = _shared_task_manager()
+        # Modelo LLM usado nos insights deste fluxo (não fica no IPAgents compartilhado)
+        self._insights_model = None
+        # Manter uma conexão aberta durante o fluxo; com `db` injetado, reaproveita a do chamador
+        self._owns_db = db is None
+        self.db = db if db is not None else BuscapiDB()
+        # Logs da busca acumulados e gravados em lote (fim do fluxo ou erro)
+        self._log_buffer = []
+        # Campo *_json do estado -> (JSON, objeto desserializado): cada JSON é lido uma vez
+        self._parsed = {}
+
+    def _parsed_state(self, field: str):
+        """Conteúdo desserializado do campo `field` (*_json) do estado; None se vazio ou inválido.
+
+        O resultado fica em cache enquanto o JSON do campo não mudar.
+        """
+        json_str = getattr(self.state, field)
+        cached = self._parsed.get(field)
+        if cached is not None and cached[0] is json_str:
+            return cached[1]
+        try:
+            value = json_utils.loads(json_str) if json_str else None
+        except (json_utils.JSONDecodeError, TypeError):
+            value = None
+        self._parsed[field] = (json_str, value)
+        return value
+
+    def _log(self, log_msg: str):
+        """Acumula um log da busca; a gravação é feita em lote por `_flush_logs`."""
+        if self.state.search_query_id:
+            self._log_buffer.append((self.state.search_query_id, log_msg, datetime.now()))
+
+    def _flush_logs(self):
+        """Grava os logs acumulados em um único INSERT."""
+        if not self._log_buffer:
+            return
+        entries, self._log_buffer = self._log_buffer, []
+        try:
+            self.db.insert_search_logs(entries)
+        except Exception as e:
+            print(f"Aviso: falha ao gravar logs da busca: {e}")
 
     def _handle_error(self, step_name: str, e: Exception):
         """Centraliza o tratamento de erros."""
         error_msg = f"Erro no passo '{step_name}': {e}"
         print(f"❌ {error_msg}\n{traceback.format_exc()}")
         self.state.error_message = error_msg
-        if self.state.search_query_id:
-            self.db.insert_search_log(self.state.search_query_id, error_msg)
+        self._log(error_msg)
+        self._flush_logs()
         # Retorna a mensagem de erro para parar o fluxo
         return error_msg
 
@@ -61,7 +122,7 @@ class PropriedadeIntelectualFlow(Flow[PropriedadeIntelectualState]):
         
             log_msg = f"Fluxo iniciado para a busca ID {self.state.search_query_id} com critério: '{self.state.search_criteria}'"
             print(f"🚀 {log_msg}")
-            self.db.insert_search_log(self.state.search_query_id, log_msg)
+            self._log(log_msg)
             return "Início da coleta de dados."
 
     # flows/ip_flow.py
@@ -72,7 +133,7 @@ class PropriedadeIntelectualFlow(Flow[PropriedadeIntelectualState]):
         try:
             # Cria a task de coleta e delega a execução ao agent associado
             collection_task = self.task_manager.create_data_collection_task()
-            task_input = json.dumps({
+            task_input = json_utils.dumps({
                 'query': self.state.search_criteria,
                 'search_query_id': self.state.search_query_id
             })
@@ -82,15 +143,12 @@ class PropriedadeIntelectualFlow(Flow[PropriedadeIntelectualState]):
             except Exception as e:
                 raise RuntimeError(f'Falha ao executar task de coleta: {e}')
 
-            try:
-                raw_list = json.loads(self.state.raw_data_json) if self.state.raw_data_json else []
-                num_results = len(raw_list) if isinstance(raw_list, list) else 0
-            except Exception:
-                raw_list, num_results = [], 0
+            raw_list = self._parsed_state('raw_data_json')
+            num_results = len(raw_list) if isinstance(raw_list, list) else 0
 
             log_msg = f"Coleta concluída. {num_results} resultados brutos obtidos e persistidos."
             print(f"✅ {log_msg}")
-            self.db.insert_search_log(self.state.search_query_id, log_msg)
+            self._log(log_msg)
             return "Coleta de dados finalizada."
         except Exception as e:
             return self._handle_error("coletar_dados", e)
@@ -107,22 +165,29 @@ class PropriedadeIntelectualFlow(Flow[PropriedadeIntelectualState]):
                 self.state.classified_data_json = self.task_manager.execute_task(classification_task, self.state.raw_data_json, retries=2)
             except Exception as e:
                 if self.db and self.state.search_query_id:
-                    self.db.insert_search_log(self.state.search_query_id, f"Erro na classificação: {str(e)}")
+                    self._log(f"Erro na classificação: {str(e)}")
                 raise
-            try:
-                classified_count = len(json.loads(self.state.classified_data_json)) if self.state.classified_data_json else 0
-            except Exception:
-                classified_count = 0
+            classified = self._parsed_state('classified_data_json')
+            classified_count = len(classified) if isinstance(classified, (list, dict)) else 0
+
+            # Itens cujo resultado bruto não foi persistido (db_raw_id = -1) ficam fora da classificação
+            raw_list = self._parsed_state('raw_data_json')
+            dropped = sum(
+                1 for item in raw_list
+                if isinstance(item, dict) and isinstance(item.get('db_raw_id'), int) and item['db_raw_id'] < 0
+            ) if isinstance(raw_list, list) else 0
+            if dropped:
+                self._log(f"Aviso: {dropped} resultados coletados não foram persistidos e ficaram fora da classificação.")
 
             if self.db and self.state.search_query_id:
-                self.db.insert_search_log(self.state.search_query_id, f"{classified_count} resultados classificados (persistência feita pela ferramenta).")
+                self._log(f"{classified_count} resultados classificados (persistência feita pela ferramenta).")
 
             print(f"✅ Classificação concluída: {classified_count} registros (persistidos pela ferramenta)")
             return f"Classificação concluída: {classified_count} registros válidos"
 
         except Exception as e:
             if self.db and self.state.search_query_id:
-                self.db.insert_search_log(self.state.search_query_id, f"Erro na classificação: {str(e)}")
+                self._log(f"Erro na classificação: {str(e)}")
             print(f"❌ Erro na classificação: {str(e)}")
             return f"Erro na classificação: {str(e)}"
 
@@ -142,59 +207,104 @@ class PropriedadeIntelectualFlow(Flow[PropriedadeIntelectualState]):
                     analysis_task,
                     self.state.classified_data_json,
                     preferred_tool_cls=DataAnalysisTool,
-                    retries=2
+                    retries=2,
+                    cache=True
                 )
             except Exception as e:
                 raise RuntimeError(f'Falha ao executar análise de dados: {e}')
 
             log_msg = "Analise de dados conlcuida com Sucesso"
             print(f"✅ {log_msg}")
-            self.db.insert_search_log(self.state.search_query_id, log_msg)
+            self._log(log_msg)
             print ("Analise de dados conlcuida com Sucesso em ip_flow")
             return "Análise de dados finalizada."
         except Exception as e:
             return self._handle_error("analisar_dados", e)
 
+    def _executar_visualizacoes(self) -> str:
+        # Executa geração de visualizações via task/agent
+        visualization_task = self.task_manager.create_visualization_task()
+        # Mantemos o JSON string no state e passamos a string adiante para as ferramentas
+        try:
+            return self.task_manager.execute_task(
+                visualization_task,
+                self.state.analysis_results_json,
+                preferred_tool_cls=VisualizationTool,
+                retries=1,
+                cache=True
+            )
+        except Exception as e:
+            if self.db and self.state.search_query_id:
+                self._log(f"Erro na execução da visualização: {e}")
+            raise
+
+    def _gerar_insights(self) -> Optional[str]:
+        analysis = self._parsed_state('analysis_results_json') if self.state.analysis_results_json else {}
+        classified = self._parsed_state('classified_data_json') if self.state.classified_data_json else []
+        if not isinstance(analysis, dict) or not isinstance(classified, list):
+            return None
+        insights = self.agents.generate_insights_via_llm(analysis=analysis, classified=classified)
+        if insights is not None:
+            self._insights_model = self.agents.current_llm_model()
+        return insights
+
+    @staticmethod
+    def _insights_from_analysis(analysis_results: dict) -> Optional[str]:
+        """Insights básicos (sem LLM) a partir dos escalares pré-calculados pelo DataAnalysisTool."""
+        pre = analysis_results.get("_insights_precomputed") or {}
+        insights = []
+        if "most_common_category" in pre:
+            insights.append(
+                f"A categoria mais comum é '{pre['most_common_category']}' com {pre['most_common_count']} registros"
+                f" ({pre['most_common_count'] / pre['category_total'] * 100:.1f}% do total)."
+            )
+        if "trend" in pre:
+            insights.append(
+                f"A tendência temporal é {pre['trend']}, com {pre['latest_year_count']} registros "
+                f"no ano mais recente ({pre['latest_year']})."
+            )
+        return " ".join(insights) if insights else None
+
     @listen(analisar_dados)
-    def gerar_visualizacoes(self, previous_output: str) -> str:
+    async def gerar_visualizacoes(self, previous_output: str) -> str:
         if not self.state.analysis_results_json:
             return previous_output
         try:
-            # Executa geração de visualizações via task/agent
-            visualization_task = self.task_manager.create_visualization_task()
-            # Mantemos o JSON string no state e passamos a string adiante para as ferramentas
-            try:
-                self.state.visualizations_json = self.task_manager.execute_task(
-                    visualization_task,
-                    self.state.analysis_results_json,
-                    preferred_tool_cls=VisualizationTool,
-                    retries=1
-                )
-            except Exception as e:
-                if self.db and self.state.search_query_id:
-                    self.db.insert_search_log(self.state.search_query_id, f"Erro na execução da visualização: {e}")
-                raise
+            # Visualizações e insights dependem apenas do resultado da análise: rodam em
+            # paralelo (cada um em uma thread) e o passo termina quando ambos concluírem.
+            # Uma falha (ou estouro de prazo) nos insights não descarta as visualizações.
+            visualizations_json, insights = await asyncio.gather(
+                asyncio.wait_for(asyncio.to_thread(self._executar_visualizacoes), VISUALIZATION_TIMEOUT_SECONDS),
+                asyncio.wait_for(asyncio.to_thread(self._gerar_insights), INSIGHTS_TIMEOUT_SECONDS),
+                return_exceptions=True,
+            )
+            if isinstance(visualizations_json, asyncio.TimeoutError):
+                raise RuntimeError(f"tempo limite ({VISUALIZATION_TIMEOUT_SECONDS}s) excedido ao gerar visualizações")
+            if isinstance(visualizations_json, BaseException):
+                raise visualizations_json
+            self.state.visualizations_json = visualizations_json
+            if isinstance(insights, asyncio.TimeoutError):
+                insights = RuntimeError(f"tempo limite ({INSIGHTS_TIMEOUT_SECONDS}s) excedido")
+            if isinstance(insights, BaseException):
+                print(f"⚠️ Falha ao gerar insights via LLM: {insights}")
+                self._log(f"Erro na geração de insights: {insights}")
+                insights = None
+            self.state.insights = insights
 
             print("📊 Visualizações geradas com sucesso")
             return "Visualizações geradas"
         except Exception as e:
             if self.db and self.state.search_query_id:
-                self.db.insert_search_log(self.state.search_query_id, f"Erro na geração de visualizações: {str(e)}")
+                self._log(f"Erro na geração de visualizações: {str(e)}")
             return self._handle_error("gerar_visualizacoes", e)
 
     def _generate_final_report(self):
         try:
-            # Helper interno para carregar JSONs com segurança
-            def _safe_json_load(json_str, default_value):
-                try:
-                    return json.loads(json_str) if json_str else default_value
-                except (json.JSONDecodeError, TypeError):
-                    return default_value
-
-            classified_data = _safe_json_load(self.state.classified_data_json, [])
-            analysis_results = _safe_json_load(self.state.analysis_results_json, {})
-            visualizations = _safe_json_load(self.state.visualizations_json, {})
-            raw_data = _safe_json_load(self.state.raw_data_json, [])
+            # Reaproveita o que os passos anteriores já desserializaram
+            classified_data = self._parsed_state('classified_data_json') or []
+            analysis_results = self._parsed_state('analysis_results_json') or {}
+            visualizations = self._parsed_state('visualizations_json') or {}
+            raw_data = self._parsed_state('raw_data_json') or []
 
             self.state.final_report = {
                 "success": True,
@@ -204,16 +314,20 @@ class PropriedadeIntelectualFlow(Flow[PropriedadeIntelectualState]):
                 "classified_data": classified_data,
                 "analysis_results": analysis_results,
                 "visualizations": visualizations,
-                # O campo 'llm_model' será preenchido pelo agente que invocou a LLM (se disponível).
-                "llm_model": getattr(self.agents, 'last_used_llm_model', None),
-                "insights": analysis_results.get('insights', 'Nenhum insight gerado.')
+                # Modelo que gerou os insights deste fluxo (se a LLM foi usada).
+                "llm_model": self._insights_model,
+                # Sem insights da LLM, recorre aos insights básicos calculados da análise
+                "insights": (self.state.insights
+                             or analysis_results.get('insights')
+                             or (self._insights_from_analysis(analysis_results) if isinstance(analysis_results, dict) else None)
+                             or 'Nenhum insight gerado.')
             }
 
             # Marca o registro como concluído e adiciona log
             if self.db and self.state.search_query_id:
                 try:
                     self.db.update_search_query_status(self.state.search_query_id, 'completed')
-                    self.db.insert_search_log(self.state.search_query_id, "Fluxo concluído e relatório final gerado.")
+                    self._log("Fluxo concluído e relatório final gerado.")
                 except Exception as db_e:
                     print(f"Aviso: falha ao atualizar status no DB: {db_e}")
 
@@ -230,7 +344,7 @@ class PropriedadeIntelectualFlow(Flow[PropriedadeIntelectualState]):
                     'output_path': pdf_job_meta.get('output_path')
                 }
                 if self.db and self.state.search_query_id:
-                    self.db.insert_search_log(self.state.search_query_id, f"PDF generation enqueued: job_id={pdf_job_meta.get('job_id')}")
+                    self._log(f"PDF generation enqueued: job_id={pdf_job_meta.get('job_id')}")
             # Observação sobre diferenças de design nas visualizações:
             # Ao incluir gráficos gerados por Plotly em relatórios PDF, o fluxo converte
             # figuras interativas em imagens (PNG). Isso pode alterar detalhes do visual,
@@ -242,13 +356,13 @@ class PropriedadeIntelectualFlow(Flow[PropriedadeIntelectualState]):
             except Exception as pj_e:
                 print(f"Aviso: falha ao enfileirar geração de PDF: {pj_e}")
                 if self.db and self.state.search_query_id:
-                    self.db.insert_search_log(self.state.search_query_id, f"Falha ao enfileirar PDF: {pj_e}")
+                    self._log(f"Falha ao enfileirar PDF: {pj_e}")
 
             print("📑 Relatório final gerado com sucesso (PDF enfileirado)")
             return self.state.final_report
         except Exception as e:
             if self.db and self.state.search_query_id:
-                self.db.insert_search_log(self.state.search_query_id, f"Erro ao gerar relatório final: {str(e)}")
+                self._log(f"Erro ao gerar relatório final: {str(e)}")
             return self._handle_error("generate_final_report", e)
 
     def kickoff(self, state: PropriedadeIntelectualState = None) -> Dict[str, Any]:
@@ -259,12 +373,15 @@ class PropriedadeIntelectualFlow(Flow[PropriedadeIntelectualState]):
 
         # Chama o kickoff da superclasse, passando o dicionário de inputs.
         # A superclasse cuidará de inicializar o estado interno corretamente.
-        super().kickoff(inputs=initial_inputs)
-
-        # Após a execução do fluxo, gera o relatório final
-        self._generate_final_report()
+        try:
+            super().kickoff(inputs=initial_inputs)
 
-        self.db.close()
+            # Após a execução do fluxo, gera o relatório final
+            self._generate_final_report()
+        finally:
+            self._flush_logs()
+            if self._owns_db:
+                self.db.close()
 
         return self.state.final_report
 
@@ -275,27 +392,58 @@ class IPAnalysisService:
     Serviço que orquestra o PropriedadeIntelectualFlow para análise de PI.
     """
     
-    def __init__(self):
-        """Inicializa o serviço."""
-        pass
+    def __init__(self, db_pool=None):
+        """Inicializa o serviço.
+
+        Com `db_pool` (ver `create_connection_pool`), as conexões são emprestadas do pool
+        em vez de abertas (e fechadas) a cada chamada. Cada análise segura a conexão durante
+        todo o fluxo, então o pool deve ser exclusivo das análises; com todas as conexões em
+        uso, as próximas chamadas esperam uma ser devolvida.
+        """
+        self.db_pool = db_pool
+        # O ThreadedConnectionPool não bloqueia quando esgotado (levanta PoolError)
+        self._db_slots = threading.BoundedSemaphore(db_pool.maxconn) if db_pool is not None else None
+
+    @contextmanager
+    def _db(self):
+        """Fornece um BuscapiDB para uma chamada, emprestado do pool quando houver."""
+        if self.db_pool is None:
+            db = BuscapiDB()
+            try:
+                yield db
+            finally:
+                db.close()
+            return
+        with self._db_slots:
+            conn = self.db_pool.getconn()
+            try:
+                db = BuscapiDB(conn=conn)
+                try:
+                    yield db
+                finally:
+                    db.close()
+            finally:
+                self.db_pool.putconn(conn)
 
     def start_analysis(self, search_criteria: str) -> str:
         """
         Cria o registro inicial da busca no banco de dados e retorna o ID.
         """
-        db = BuscapiDB()
-        try:
+        with self._db() as db:
             search_query_id = db.insert_search_query(criteria=search_criteria, status='pending')
             db.insert_search_log(search_query_id, "Registro de busca criado. Aguardando execução do Flow.")
             return search_query_id
-        finally:
-            db.close()
 
     def execute_analysis(self, search_query_id: int) -> Dict[str, Any]:
         """
         Executa o fluxo completo do crewai-flow usando o ID da busca.
+
+        O fluxo usa a mesma conexão do serviço (uma única conexão por análise).
         """
-        db = BuscapiDB()
+        with self._db() as db:
+            return self._execute_analysis(db, search_query_id)
+
+    def _execute_analysis(self, db: BuscapiDB, search_query_id: int) -> Dict[str, Any]:
         try:
             query_info = db.get_search_query_by_id(search_query_id)
             if not query_info:
@@ -305,7 +453,7 @@ class IPAnalysisService:
             db.update_search_query_status(search_query_id, 'processing')
             
             # 1. Criar a instância do fluxo
-            ip_flow = PropriedadeIntelectualFlow()
+            ip_flow = PropriedadeIntelectualFlow(db=db)
             
             # 2. Definir o estado inicial
             initial_state = PropriedadeIntelectualState(
@@ -322,5 +470,3 @@ class IPAnalysisService:
             db.update_search_query_status(search_query_id, 'error')
             db.insert_search_log(search_query_id, error_msg)
             return {"error": error_msg}
-        finally:
-            db.close()
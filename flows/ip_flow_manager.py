@@ -1,3 +1,4 @@
+import asyncio
 from typing import Dict, Optional
 from flows.ip_flow import PropriedadeIntelectualFlow
 
@@ -18,11 +19,19 @@ class IPFlowManager:
         if not flow:
             return {"error": f"Fluxo '{flow_id}' não encontrado"}
         try:
-            result = flow.kickoff()
-            report = flow.get_final_report()
-            return report
+            # O kickoff já devolve o relatório final, com os dados classificados
+            # desserializados (lista de dicts), pronto para o resumo por categoria.
+            return flow.kickoff()
         except Exception as e:
             return {"error": f"Erro ao executar fluxo: {str(e)}"}
 
+    async def execute_flow_async(self, flow_id: str) -> dict:
+        """Executa o fluxo sem bloquear o event loop.
+
+        O kickoff do fluxo faz chamadas bloqueantes (requests/psycopg2), por isso roda
+        em uma thread de trabalho; vários fluxos podem então ser aguardados em paralelo.
+        """
+        return await asyncio.to_thread(self.execute_flow, flow_id)
+
     def list_flows(self):
         return list(self.active_flows.keys())
@@ -1,8 +1,25 @@
 from crewai import Task
 from agents.ip_agents import IPAgents
 from typing import Dict, Any
-import json
+import hashlib
+import threading
 import time
+from collections import OrderedDict
+
+from tools import json_utils
+
+# Memo das saídas (JSON já serializado) de ferramentas determinísticas e sem efeitos
+# colaterais, chaveado por (ferramenta, entrada); compartilhado pelo processo, em LRU.
+_TASK_CACHE_MAX_ENTRIES = 128
+_task_cache: "OrderedDict[str, str]" = OrderedDict()
+_task_cache_lock = threading.Lock()
+
+
+def _task_cache_key(tool, input_str: str) -> str:
+    digest = hashlib.blake2b(type(tool).__qualname__.encode('utf-8'), digest_size=20)
+    digest.update(b'\0')
+    digest.update(input_str.encode('utf-8') if isinstance(input_str, str) else repr(input_str).encode('utf-8'))
+    return digest.hexdigest()
 
 class IPTaskFactory:
     """Factory para criar tarefas de propriedade intelectual."""
@@ -43,7 +60,8 @@ class IPTaskFactory:
             description='''Sua missão é analisar os dados classificados de propriedade intelectual fornecidos no contexto.
                            Primeiro, utilize a 'Data Analysis Tool' para extrair estatísticas numéricas, como contagens por categoria e por ano.
                            Depois, com base nesses números, interprete os resultados e escreva um parágrafo conciso com os 'insights' mais importantes.
-                           Foque em identificar a categoria mais proeminente e a tendência temporal (crescente, decrescente ou estável).''',
+                           Foque em identificar a categoria mais proeminente e a tendência temporal (crescente, decrescente ou estável).
+                           Assim que o JSON estiver completo, entregue-o como resposta final, sem iterações adicionais.''',
             agent=self.agents.insight_coordinator,
             expected_output='''Um relatório em formato JSON. O JSON deve conter duas chaves principais:
                                1. 'statistics': Um dicionário com os dados numéricos brutos da ferramenta de análise (ex: 'count_by_category', 'count_by_year').
@@ -140,12 +158,16 @@ class IPTaskManager:
     def create_visualization_task(self, visualization_type: str = "dashboard completo") -> Task:
         return self.task_factory.create_visualization_task(visualization_type)
 
-    def execute_task(self, task: Task, input_str: str, preferred_tool_cls: type = None, preferred_tool_name: str = None, retries: int = 1) -> str:
+    def execute_task(self, task: Task, input_str: str, preferred_tool_cls: type = None, preferred_tool_name: str = None, retries: int = 1,
+                     cache: bool = False) -> str:
         """Executa a Task escolhendo a ferramenta apropriada no Agent e normaliza a saída.
 
         - Seleciona a ferramenta por classe (`preferred_tool_cls`) ou por nome (`preferred_tool_name`) quando informado.
         - Faz até `retries` tentativas em caso de exceção.
         - Garante que o retorno seja uma string JSON (serializa listas/dicts quando necessário).
+        - Com `cache=True`, reaproveita a saída de uma execução anterior da mesma ferramenta com a
+          mesma entrada. Use apenas com ferramentas sem efeitos colaterais (ex: análise e
+          visualização); coleta e classificação gravam no banco e não devem ser memoizadas.
         """
         agent = getattr(task, 'agent', None)
         if not agent:
@@ -179,17 +201,27 @@ class IPTaskManager:
         if not chosen:
             raise RuntimeError('Agent não possui ferramenta executável')
 
+        cache_key = _task_cache_key(chosen, input_str) if cache else None
+        if cache_key:
+            with _task_cache_lock:
+                cached = _task_cache.get(cache_key)
+                if cached is not None:
+                    _task_cache.move_to_end(cache_key)
+                    return cached
+
         last_exc = None
         for attempt in range(1, max(1, retries) + 1):
             try:
                 out = chosen._run(input_str)
                 # Normalizar saída: garantir string JSON
-                if isinstance(out, str):
-                    return out
-                try:
-                    return json.dumps(out, ensure_ascii=False)
-                except Exception:
-                    return str(out)
+                if not isinstance(out, str):
+                    out = json_utils.dumps(out)
+                if cache_key:
+                    with _task_cache_lock:
+                        _task_cache[cache_key] = out
+                        if len(_task_cache) > _TASK_CACHE_MAX_ENTRIES:
+                            _task_cache.popitem(last=False)
+                return out
             except Exception as e:
                 last_exc = e
                 # pequeno backoff
@@ -1,15 +1,14 @@
-import json
 import os
+import threading
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from uuid import uuid4
 from pathlib import Path
 from typing import Dict, Any
 
-import plotly.io as pio
-import plotly.graph_objects as go
-
 from tools.custom_tools import PDFReportTool
+from tools import json_utils
+from tools.figure_utils import CHART_IMAGE_EXT, to_figure
 from database.persist_dados import BuscapiDB
 
 
@@ -17,17 +16,60 @@ from database.persist_dados import BuscapiDB
 JOBS_DIR = Path("static/pdf_jobs")
 JOBS_DIR.mkdir(parents=True, exist_ok=True)
 
+# Índice search_query_id -> job_id (uma linha JSON por job, em ordem de criação), para
+# listar os PDFs de uma busca sem abrir todos os metadados do diretório
+JOBS_INDEX_PATH = JOBS_DIR / "_by_query.jsonl"
+_index_lock = threading.Lock()
+
+# Escala das imagens dos gráficos no PDF (desenhadas em 6x4 polegadas pelo PDFGenerator)
+PDF_IMAGE_SCALE = float(os.getenv('PDF_IMAGE_SCALE', '1'))
+
 # Executor global simples
 _executor = ThreadPoolExecutor(max_workers=2)
 
 # Estado em memória (pode ser usado para consultas rápidas)
 _jobs: Dict[str, Dict[str, Any]] = {}
 
+# Metadados lidos do disco: job_id -> (mtime do arquivo, meta)
+_job_meta_cache: Dict[str, tuple] = {}
+
 
 def _persist_job_meta(job_id: str, meta: Dict[str, Any]):
     path = JOBS_DIR / f"{job_id}.json"
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2, default=str)
+    with open(path, 'wb') as f:
+        f.write(json_utils.dumps_bytes(meta, indent=True))
+
+
+def _rebuild_jobs_index():
+    """Reconstrói o índice a partir dos metadados existentes (chamar com `_index_lock`)."""
+    records = []
+    with os.scandir(JOBS_DIR) as it:
+        for entry in it:
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path, 'rb') as f:
+                    meta = json_utils.loads(f.read())
+            except Exception:
+                continue
+            if meta.get('search_query_id') is not None:
+                records.append((meta.get('queued_at') or '', meta['search_query_id'], meta.get('job_id') or entry.name[:-5]))
+    records.sort()
+    with open(JOBS_INDEX_PATH, 'wb') as f:
+        for _, sqid, job_id in records:
+            f.write(json_utils.dumps_bytes({"search_query_id": sqid, "job_id": job_id}) + b"\n")
+
+
+def _index_job(job_id: str, search_query_id: int):
+    if search_query_id is None:
+        return
+    with _index_lock:
+        if not JOBS_INDEX_PATH.exists():
+            # A reconstrução já inclui o job recém-persistido
+            _rebuild_jobs_index()
+            return
+        with open(JOBS_INDEX_PATH, 'ab') as f:
+            f.write(json_utils.dumps_bytes({"search_query_id": search_query_id, "job_id": job_id}) + b"\n")
 
 
 def _run_pdf_job(job_id: str, results: Dict[str, Any], output_path: str, extra_meta: Dict[str, Any] = None):
@@ -38,7 +80,7 @@ def _run_pdf_job(job_id: str, results: Dict[str, Any], output_path: str, extra_m
 
     try:
         # Preparar visualizações: se forem representações Plotly (JSON/dict/list),
-        # converte para imagens PNG e atualiza results['visualizations'] para paths.
+        # converte para imagens (SVG/PNG) e atualiza results['visualizations'] para paths.
         try:
             viz = results.get('visualizations') if isinstance(results, dict) else None
             if isinstance(viz, dict):
@@ -46,32 +88,13 @@ def _run_pdf_job(job_id: str, results: Dict[str, Any], output_path: str, extra_m
                 temp_dir.mkdir(parents=True, exist_ok=True)
                 img_paths = {}
                 for name, v in viz.items():
-                    fig = None
                     try:
-                        # string JSON do Plotly
-                        if isinstance(v, str):
-                            try:
-                                fig = pio.from_json(v)
-                            except Exception:
-                                parsed = json.loads(v)
-                                if isinstance(parsed, dict):
-                                    fig = go.Figure(parsed)
-                                elif isinstance(parsed, list):
-                                    fig = go.Figure(data=parsed)
-
-                        elif isinstance(v, dict):
-                            try:
-                                fig = go.Figure(v)
-                            except Exception:
-                                fig = go.Figure(data=v.get('data', []), layout=v.get('layout', {}))
-
-                        elif isinstance(v, list):
-                            fig = go.Figure(data=v)
+                        fig = to_figure(v)
 
                         if fig is not None:
-                            img_path = str(temp_dir / f"{name}_{job_id}.png")
+                            img_path = str(temp_dir / f"{name}_{job_id}.{CHART_IMAGE_EXT}")
                             try:
-                                fig.write_image(img_path, scale=2)
+                                fig.write_image(img_path, scale=PDF_IMAGE_SCALE)
                                 img_paths[name] = img_path
                             except Exception as e:
                                 # falha ao escrever imagem: registra e pula
@@ -79,17 +102,18 @@ def _run_pdf_job(job_id: str, results: Dict[str, Any], output_path: str, extra_m
                     except Exception as _:
                         continue
 
-                if img_paths:
-                    results = dict(results)
-                    results['visualizations'] = img_paths
+                # Valores que não viraram imagem só seguem adiante se já forem caminhos
+                # (str); payloads em bytes não são serializáveis para o PDFReportTool.
+                results = dict(results)
+                results['visualizations'] = img_paths or {k: v for k, v in viz.items() if isinstance(v, str)}
         except Exception as vv:
             print(f"Aviso: não foi possível converter visualizações para imagens: {vv}")
 
         tool = PDFReportTool()
         payload = {"results": results, "output_path": output_path}
-        resp = tool._run(json.dumps(payload, ensure_ascii=False))
+        resp = tool._run(json_utils.dumps(payload))
         try:
-            parsed = json.loads(resp)
+            parsed = json_utils.loads(resp)
         except Exception:
             parsed = {"error": "invalid_response", "raw": resp}
 
@@ -155,6 +179,7 @@ def enqueue_pdf_job(results: Dict[str, Any], output_path: str = None, search_que
 
     _jobs[job_id] = meta
     _persist_job_meta(job_id, meta)
+    _index_job(job_id, search_query_id)
 
     # Submit to executor, incluindo meta extra (ex: search_query_id e llm_model)
     extra = {"search_query_id": search_query_id, "llm_model": llm_model}
@@ -167,7 +192,36 @@ def get_job_meta(job_id: str) -> Dict[str, Any]:
     if job_id in _jobs:
         return _jobs[job_id]
     path = JOBS_DIR / f"{job_id}.json"
-    if path.exists():
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {"error": "not_found"}
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return {"error": "not_found"}
+    # Metadados de jobs de outros processos: reaproveita o parse enquanto o arquivo não mudar
+    cached = _job_meta_cache.get(job_id)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as f:
+        meta = json_utils.loads(f.read())
+    _job_meta_cache[job_id] = (mtime, meta)
+    return meta
+
+
+def list_jobs_for_query(search_query_id: int) -> list:
+    """Retorna os metadados dos jobs de PDF de uma busca, do mais recente ao mais antigo."""
+    with _index_lock:
+        if not JOBS_INDEX_PATH.exists():
+            _rebuild_jobs_index()
+        with open(JOBS_INDEX_PATH, 'rb') as f:
+            lines = f.read().splitlines()
+
+    job_ids = []
+    for line in lines:
+        try:
+            rec = json_utils.loads(line)
+        except Exception:
+            continue
+        if rec.get('search_query_id') == search_query_id:
+            job_ids.append(rec.get('job_id'))
+
+    metas = (get_job_meta(job_id) for job_id in reversed(job_ids))
+    return [meta for meta in metas if meta.get('job_id')]
@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+from app import IPAnalysisSystem
+
+
+def _write_jsonl(path, entries, tail=''):
+    path.write_text(''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in entries) + tail, encoding='utf-8')
+
+
+def _read_jsonl(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def _write_config(tmp_path, criteria, output):
+    config = tmp_path / 'batch.json'
+    config.write_text(json.dumps({
+        'output_file': str(output),
+        'searches': [{'criteria': c} for c in criteria],
+    }), encoding='utf-8')
+    return config
+
+
+def _batch_system(run_analysis_async):
+    # Sem fluxos/agentes reais: só o modo batch é exercitado
+    system = IPAnalysisSystem.__new__(IPAnalysisSystem)
+    system.run_analysis_async = run_analysis_async
+    return system
+
+
+def test_run_batch_mode_runs_searches_concurrently_up_to_the_limit(tmp_path):
+    output = tmp_path / 'batch_results.jsonl'
+    config = _write_config(tmp_path, ['grafeno', 'lítio', 'cobre', 'nióbio'], output)
+    running = peak = 0
+
+    async def fake_run_analysis_async(search_criteria, flow_id=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return {'success': True}
+
+    _batch_system(fake_run_analysis_async).run_batch_mode(str(config), max_concurrency=2)
+
+    assert peak == 2
+    assert sorted(e['flow_id'] for e in _read_jsonl(output)) == [f'batch_flow_{i}' for i in range(1, 5)]
+
+
+def test_load_batch_checkpoint_only_counts_successful_entries(tmp_path):
+    output = tmp_path / 'batch_results.jsonl'
+    _write_jsonl(output, [
+        {'flow_id': 'batch_flow_1', 'criteria_key': 'grafeno', 'result': {'success': True}},
+        {'flow_id': 'batch_flow_2', 'criteria_key': 'lítio', 'error': 'timeout'},
+        {'flow_id': 'batch_flow_3', 'criteria_key': 'cobre', 'result': {'error': 'falha no fluxo'}},
+        # Linha de uma execução antiga, sem criteria_key
+        {'flow_id': 'batch_flow_4', 'result': {'success': True}},
+    ], tail='{"flow_id": "batch_fl')  # linha truncada por uma queda no meio da escrita
+
+    assert IPAnalysisSystem._load_batch_checkpoint(str(output)) == {'grafeno'}
+
+
+def test_load_batch_checkpoint_without_output_file(tmp_path):
+    assert IPAnalysisSystem._load_batch_checkpoint(str(tmp_path / 'inexistente.jsonl')) == set()
+
+
+def test_run_batch_mode_resumes_from_checkpoint(tmp_path):
+    output = tmp_path / 'batch_results.jsonl'
+    _write_jsonl(output, [{'flow_id': 'batch_flow_1', 'criteria_key': 'grafeno', 'result': {'success': True}}])
+    config = _write_config(tmp_path, ['Grafeno', 'lítio', 'cobre'], output)
+    calls = []
+
+    async def fake_run_analysis_async(search_criteria, flow_id=None):
+        calls.append((search_criteria, flow_id))
+        return {'error': 'falha no fluxo'} if search_criteria == 'cobre' else {'success': True}
+
+    _batch_system(fake_run_analysis_async).run_batch_mode(str(config))
+
+    # A retomada segue o critério, não a posição da busca na configuração
+    assert set(calls) == {('lítio', 'batch_flow_2'), ('cobre', 'batch_flow_3')}
+    # A busca que falhou fica fora do checkpoint e será reexecutada na próxima retomada
+    assert IPAnalysisSystem._load_batch_checkpoint(str(output)) == {'grafeno', 'lítio'}
+
+
+def test_criteria_key_ignores_case_and_surrounding_spaces():
+    assert IPAnalysisSystem._criteria_key('  Grafeno ') == IPAnalysisSystem._criteria_key('grafeno')
+    assert IPAnalysisSystem._criteria_key(None) == ''
+
+
+def test_run_batch_mode_runs_duplicate_criteria_once(tmp_path):
+    output = tmp_path / 'batch_results.jsonl'
+    config = _write_config(tmp_path, [' Lítio ', 'cobre', 'lítio'], output)
+    calls = []
+
+    async def fake_run_analysis_async(search_criteria, flow_id=None):
+        calls.append((search_criteria, flow_id))
+        return {'success': True, 'criteria': search_criteria}
+
+    _batch_system(fake_run_analysis_async).run_batch_mode(str(config))
+
+    assert sorted(calls) == [(' Lítio ', 'batch_flow_1'), ('cobre', 'batch_flow_2')]
+    # O resultado da execução única é replicado para cada flow_id duplicado
+    by_flow = {e['flow_id']: e for e in _read_jsonl(output)}
+    assert sorted(by_flow) == ['batch_flow_1', 'batch_flow_2', 'batch_flow_3']
+    assert by_flow['batch_flow_3']['result'] == by_flow['batch_flow_1']['result']
@@ -0,0 +1,26 @@
+import plotly.graph_objects as go
+
+from tools import figure_utils, json_utils
+
+
+def test_to_figure_accepts_json_dict_and_trace_list():
+    fig = go.Figure(data=[go.Bar(x=['Patente', 'Marca'], y=[3, 1])])
+    traces = [{'type': 'bar', 'x': ['Patente', 'Marca'], 'y': [3, 1]}]
+    payloads = [
+        fig.to_json(),
+        fig.to_json().encode('utf-8'),
+        fig.to_dict(),
+        traces,
+        # JSON que não é uma figura completa: segue pelo construtor da lista de traces
+        json_utils.dumps(traces),
+    ]
+    for payload in payloads:
+        built = figure_utils.to_figure(payload)
+        assert isinstance(built, go.Figure)
+        assert built.data[0].type == 'bar'
+        assert list(built.data[0].y) == [3, 1]
+
+
+def test_to_figure_returns_none_for_unknown_types():
+    assert figure_utils.to_figure(None) is None
+    assert figure_utils.to_figure(42) is None
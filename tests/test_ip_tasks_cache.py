@@ -0,0 +1,68 @@
+import json
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+from tasks import ip_tasks
+from tasks.ip_tasks import IPTaskManager
+
+
+class EchoTool:
+    name = 'Echo Tool'
+
+    def __init__(self):
+        self.calls = []
+
+    def _run(self, input_str):
+        self.calls.append(input_str)
+        return {'echo': input_str}
+
+
+class OtherTool(EchoTool):
+    name = 'Other Tool'
+
+
+def _task(tool):
+    return SimpleNamespace(agent=SimpleNamespace(tools=[tool]))
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(ip_tasks, '_task_cache', OrderedDict())
+    monkeypatch.setattr(ip_tasks, '_TASK_CACHE_MAX_ENTRIES', 2)
+    return IPTaskManager(agents=None)
+
+
+def test_task_cache_key_depends_on_tool_class_and_input():
+    key = ip_tasks._task_cache_key(EchoTool(), '{"a": 1}')
+    assert key == ip_tasks._task_cache_key(EchoTool(), '{"a": 1}')
+    assert key != ip_tasks._task_cache_key(OtherTool(), '{"a": 1}')
+    assert key != ip_tasks._task_cache_key(EchoTool(), '{"a": 2}')
+
+
+def test_execute_task_cache_is_lru(manager):
+    tool = EchoTool()
+    task = _task(tool)
+
+    assert json.loads(manager.execute_task(task, 'a', cache=True)) == {'echo': 'a'}
+    manager.execute_task(task, 'b', cache=True)
+    manager.execute_task(task, 'a', cache=True)  # acerto: 'a' passa a ser o mais recente
+    manager.execute_task(task, 'c', cache=True)  # excede o limite e descarta 'b'
+    assert tool.calls == ['a', 'b', 'c']
+
+    manager.execute_task(task, 'a', cache=True)
+    manager.execute_task(task, 'b', cache=True)
+    assert tool.calls == ['a', 'b', 'c', 'b']
+    assert len(ip_tasks._task_cache) == 2
+
+
+def test_execute_task_without_cache_always_runs_tool(manager):
+    tool = EchoTool()
+    task = _task(tool)
+
+    manager.execute_task(task, 'a')
+    manager.execute_task(task, 'a')
+
+    assert tool.calls == ['a', 'a']
+    assert not ip_tasks._task_cache
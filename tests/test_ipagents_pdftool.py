@@ -15,6 +15,88 @@ def test_ipagents_instantiation():
     assert hasattr(agents, 'data_relat')
 
 
+def test_generate_insights_via_llm_reuses_cached_insights(monkeypatch):
+    agents = IPAgents()
+    llm_tool = next(t for t in agents.insight_coordinator.tools if type(t).__name__ == 'LLMTool')
+    calls = []
+
+    def fake_run(self, input_data):
+        calls.append(input_data)
+        return json.dumps({'insights': 'insight em cache'})
+
+    def no_embedding(self, text, model=None):
+        raise RuntimeError('sem embeddings no teste')
+
+    monkeypatch.setattr(type(llm_tool), '_run', fake_run)
+    monkeypatch.setattr(type(llm_tool), '_call_openai_embedding', no_embedding)
+
+    first = agents.generate_insights_via_llm(analysis={'a': 1, 'b': 2}, classified=[], model='m1')
+    # Mesmo conteúdo com outra ordem de chaves: acerto exato no cache
+    second = agents.generate_insights_via_llm(analysis={'b': 2, 'a': 1}, classified=[], model='m1')
+    assert first == second == 'insight em cache'
+    assert len(calls) == 1
+
+    # Outro modelo não reaproveita o cache
+    agents.generate_insights_via_llm(analysis={'a': 1, 'b': 2}, classified=[], model='m2')
+    assert len(calls) == 2
+
+    # Sem INSIGHT_SEMANTIC_CACHE, análises apenas similares não reaproveitam insights
+    embedded = []
+
+    def fake_embedding(self, text, model=None):
+        embedded.append(text)
+        return [1.0, 0.0]
+
+    monkeypatch.setattr(type(llm_tool), '_call_openai_embedding', fake_embedding)
+    monkeypatch.delenv('INSIGHT_SEMANTIC_CACHE', raising=False)
+    agents.generate_insights_via_llm(analysis={'total': 10}, classified=[], model='m3')
+    agents.generate_insights_via_llm(analysis={'total': 11}, classified=[], model='m3')
+    assert len(calls) == 4
+    assert embedded == []
+
+    # Com o cache semântico habilitado, resumos similares reaproveitam os insights;
+    # o embedding usa só o resumo da análise, nunca os classificados
+    monkeypatch.setenv('INSIGHT_SEMANTIC_CACHE', '1')
+    agents.generate_insights_via_llm(analysis={'total': 20}, classified=[{'title': 'x'}], model='m4')
+    agents.generate_insights_via_llm(analysis={'total': 21}, classified=[{'title': 'y'}], model='m4')
+    assert len(calls) == 5
+    assert all('title' not in text for text in embedded)
+
+
+def test_generate_insights_via_llm_does_not_cache_heuristic_fallback(monkeypatch):
+    agents = IPAgents()
+    llm_tool = next(t for t in agents.insight_coordinator.tools if type(t).__name__ == 'LLMTool')
+    attempts = []
+
+    def flaky_chat(self, messages, model=None, max_tokens=512):
+        attempts.append(messages)
+        if len(attempts) == 1:
+            raise RuntimeError('rate limit')
+        return 'insight da LLM'
+
+    monkeypatch.setattr(type(llm_tool), '_call_openai_chat', flaky_chat)
+
+    # Falha transitória: devolve a heurística, mas a próxima chamada tenta a LLM de novo
+    first = agents.generate_insights_via_llm(analysis={'count_by_category': {'Patente': 3}}, classified=[], model='m1')
+    second = agents.generate_insights_via_llm(analysis={'count_by_category': {'Patente': 3}}, classified=[], model='m1')
+    third = agents.generate_insights_via_llm(analysis={'count_by_category': {'Patente': 3}}, classified=[], model='m1')
+    assert first != 'insight da LLM'
+    assert second == third == 'insight da LLM'
+    assert len(attempts) == 2
+
+
+def test_insight_exact_cache_is_bounded(monkeypatch):
+    agents = IPAgents()
+    llm_tool = next(t for t in agents.insight_coordinator.tools if type(t).__name__ == 'LLMTool')
+    monkeypatch.setattr(type(llm_tool), '_run', lambda self, input_data: json.dumps({'insights': 'ok'}))
+    monkeypatch.setattr(IPAgents, 'INSIGHT_CACHE_MAX_ENTRIES', 2)
+
+    for total in range(5):
+        agents.generate_insights_via_llm(analysis={'total': total}, classified=[], model='m1')
+
+    assert len(agents._insight_exact_cache) == 2
+
+
 def test_pdfreporttool_generates_pdf(tmp_path: Path):
     # Prepara um payload mínimo compatível com PDFGenerator
     results = {
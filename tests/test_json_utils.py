@@ -0,0 +1,17 @@
+from tools import json_utils
+
+
+def test_json_utils_falls_back_to_stdlib_without_orjson(monkeypatch):
+    monkeypatch.setattr(json_utils, 'orjson', None)
+    data = {'b': 1, 'a': 'patente de invenção', 2024: [1, 2]}
+
+    assert json_utils.dumps_bytes(data) == '{"b":1,"a":"patente de invenção","2024":[1,2]}'.encode('utf-8')
+    assert json_utils.dumps({'b': 1, 'a': 2}, sort_keys=True) == '{"a":2,"b":1}'
+    assert json_utils.loads(b'{"a": [1, 2]}') == {'a': [1, 2]}
+
+
+def test_json_utils_serializes_what_orjson_rejects():
+    # Inteiros acima de 64 bits: o orjson recusa e a biblioteca padrão assume
+    assert json_utils.dumps({'n': 2 ** 70}) == '{"n":%d}' % 2 ** 70
+    # Objetos não serializáveis viram str
+    assert json_utils.loads(json_utils.dumps({'s': {1}})) == {'s': '{1}'}
@@ -0,0 +1,169 @@
+from datetime import datetime
+
+import pytest
+from psycopg2 import errors as pg_errors
+
+from database import persist_dados
+from database.persist_dados import BuscapiDB
+
+
+class FakeCursor:
+    def __init__(self, conn=None):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn is not None:
+            self.conn.executed.append(sql)
+            if self.conn.fail_on and self.conn.fail_on in sql:
+                raise RuntimeError('unique violation')
+
+    def fetchone(self):
+        return (self.conn.indexes_ready,)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    autocommit = False
+
+    def __init__(self, indexes_ready=True, fail_on=None):
+        self.indexes_ready = indexes_ready
+        self.fail_on = fail_on
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # Sem banco real: migração dada como aplicada e sem registrar decodificadores json
+    monkeypatch.setattr(persist_dados, '_schema_checked', True)
+    monkeypatch.setattr(persist_dados, 'register_default_json', lambda *args, **kwargs: None)
+    monkeypatch.setattr(persist_dados, 'register_default_jsonb', lambda *args, **kwargs: None)
+    return BuscapiDB(conn=FakeConnection())
+
+
+def test_ensure_schema_skips_migration_when_indexes_exist(monkeypatch):
+    monkeypatch.setattr(persist_dados, '_schema_checked', False)
+    conn = FakeConnection(indexes_ready=True)
+
+    persist_dados.ensure_schema(conn)
+
+    assert not any('ALTER TABLE' in sql for sql in conn.executed)
+    assert conn.commits == 1
+
+
+def test_ensure_schema_runs_once_per_process_even_after_failure(monkeypatch):
+    monkeypatch.setattr(persist_dados, '_schema_checked', False)
+    conn = FakeConnection(indexes_ready=False, fail_on='ALTER TABLE')
+
+    later = FakeConnection(indexes_ready=False)
+    persist_dados.ensure_schema(conn)
+    persist_dados.ensure_schema(later)
+
+    assert sum('ALTER TABLE' in sql for sql in conn.executed) == 1
+    assert later.executed == []
+    assert conn.rollbacks == 1
+    assert conn.autocommit is False
+
+
+def fake_execute_values(monkeypatch, *responses):
+    """Substitui `execute_values`; cada chamada consome uma resposta (função dos argumentos ou exceção)."""
+    calls = []
+    pending = list(responses)
+
+    def execute_values(cur, sql, argslist, template=None, page_size=100, fetch=False):
+        argslist = list(argslist)
+        calls.append((sql, argslist))
+        response = pending.pop(0) if pending else None
+        if isinstance(response, Exception):
+            raise response
+        return response(argslist) if response else None
+
+    monkeypatch.setattr(persist_dados, 'execute_values', execute_values)
+    return calls
+
+
+def test_bulk_raw_insert_dedups_batch_and_maps_ids_by_hash(db, monkeypatch):
+    # O RETURNING não garante a ordem do VALUES: devolve as linhas invertidas
+    calls = fake_execute_values(
+        monkeypatch,
+        lambda rows: [(row[3], 100 + i) for i, row in enumerate(rows)][::-1],
+    )
+    items = [{'title': 'a'}, {'title': 'b'}, {'title': 'a'}]
+
+    ids = db.insert_search_results_raw_bulk(7, 'epo', items)
+
+    assert ids == [100, 101, 100]
+    sql, rows = calls[0]
+    assert 'ON CONFLICT' in sql
+    assert len(rows) == 2
+    assert all(row[:2] == (7, 'epo') for row in rows)
+    # O hash vai no JSON gravado sem alterar o dict do chamador
+    assert persist_dados.json_utils.loads(rows[0][2])['_hash'] == rows[0][3]
+    assert items[0] == {'title': 'a'}
+
+
+def test_bulk_raw_insert_without_dedup_index_falls_back_to_plain_insert(db, monkeypatch):
+    calls = fake_execute_values(
+        monkeypatch,
+        pg_errors.InvalidColumnReference('no unique constraint matching ON CONFLICT'),
+        lambda rows: [(200 + i,) for i in range(len(rows))],
+    )
+
+    ids = db.insert_search_results_raw_bulk(7, 'epo', [{'title': 'a'}, {'title': 'b'}, {'title': 'a'}])
+
+    assert ids == [200, 201, 200]
+    sql, rows = calls[1]
+    assert 'ON CONFLICT' not in sql
+    assert [len(row) for row in rows] == [3, 3]
+
+
+def test_bulk_raw_insert_error_marks_all_items(db, monkeypatch):
+    fake_execute_values(monkeypatch, RuntimeError('conexão perdida'))
+
+    assert db.insert_search_results_raw_bulk(7, 'epo', [{'title': 'a'}, {'title': 'b'}]) == [-1, -1]
+    assert db.conn.rollbacks == 1
+
+
+def test_bulk_raw_insert_empty_skips_database(db, monkeypatch):
+    calls = fake_execute_values(monkeypatch)
+
+    assert db.insert_search_results_raw_bulk(7, 'epo', []) == []
+    assert calls == []
+
+
+def test_insert_search_logs_accepts_pairs_and_triples(db, monkeypatch):
+    calls = fake_execute_values(monkeypatch)
+    logged_at = datetime(2024, 5, 1, 12, 0)
+
+    assert db.insert_search_logs([(3, 'sem horário'), (3, 'com horário', logged_at)]) == 2
+
+    sql, rows = calls[0]
+    assert 'search_log' in sql
+    assert rows[0][:2] == (3, 'sem horário')
+    assert isinstance(rows[0][2], datetime)
+    assert rows[1] == (3, 'com horário', logged_at)
+
+
+def test_insert_search_logs_empty_skips_database(db, monkeypatch):
+    calls = fake_execute_values(monkeypatch)
+
+    assert db.insert_search_logs([]) == 0
+    assert calls == []
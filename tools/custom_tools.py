@@ -6,6 +6,9 @@ import os
 import copy
 import time
 import re
+import threading
+from contextvars import ContextVar
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from crewai.tools import BaseTool
 from datetime import datetime
@@ -17,6 +20,7 @@ except Exception:
 from database.persist_dados import BuscapiDB
 from typing import ClassVar, Optional, Tuple
 from models.patent_record import PatentRecord
+from tools import json_utils
 
 
 from dotenv import load_dotenv
@@ -46,14 +50,47 @@ def normalize_to_list(data: Optional[Any]) -> List[Any]:
         return []
     
 # --- Função para carregar regras dinâmicas de categorias ---
+@lru_cache(maxsize=8)
+def _load_category_rules_cached(file_path: str, mtime: float):
+    # `mtime` faz parte da chave: editar o arquivo invalida a entrada em cache
+    with open(file_path, 'rb') as f:
+        return json_utils.loads(f.read())
+
+
 def load_category_rules(file_path="category_rules.json"):
-    if not os.path.exists(file_path):
+    """Carrega as regras de categoria, reaproveitando o resultado enquanto o arquivo não mudar.
+
+    A lista retornada é compartilhada entre as chamadas e não deve ser modificada.
+    """
+    try:
+        mtime = os.path.getmtime(file_path)
+    except OSError:
         return []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return _load_category_rules_cached(file_path, mtime)
 
 category_rules = load_category_rules()
 
+_http_local = threading.local()
+
+
+def _http_session() -> requests.Session:
+    """Sessão HTTP reaproveitada pelas ferramentas de busca.
+
+    Mantém conexões keep-alive com os provedores (Serper, USPTO, EPO, INPI, Google
+    Patents), evitando um novo handshake TCP/TLS a cada chamada. Há uma sessão por
+    thread, pois `requests.Session` (e seus cookies) não deve ser compartilhada entre
+    threads concorrentes no modo batch.
+    """
+    session = getattr(_http_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _http_local.session = session
+    return session
+
+
 class SerperDevTool(BaseTool):
     name: str = "Serper Dev Tool"
     description: str = "Ferramenta para realizar buscas na web usando a API SerperDev."
@@ -69,7 +106,7 @@ class SerperDevTool(BaseTool):
         url = "https://google.serper.dev/search"
         payload = json.dumps({"q": query})
         try:
-            response = requests.request("POST", url, headers=headers, data=payload)
+            response = _http_session().request("POST", url, headers=headers, data=payload)
             response.raise_for_status()
             serper_results = json.dumps(response.json())
             return serper_results
@@ -94,7 +131,7 @@ class USPTO_PatentSearchTool(BaseTool):
             "Accept": "application/json"
         }
         try:
-            response = requests.get(base_url, params=params, headers=headers)
+            response = _http_session().get(base_url, params=params, headers=headers)
             response.raise_for_status()
             data = response.json()
             extracted_data = []
@@ -132,7 +169,7 @@ class EPO_PatentSearchTool(BaseTool):
         last_error_message = "Causa desconhecida"
         for attempt in range(retries):
             try:
-                resp = requests.get(url, headers=headers, params=params, timeout=timeout)
+                resp = _http_session().get(url, headers=headers, params=params, timeout=timeout)
                 resp.raise_for_status()
                 # Retorna a resposta bem-sucedida e nenhuma mensagem de erro
                 return resp, None
@@ -155,7 +192,7 @@ class EPO_PatentSearchTool(BaseTool):
 
         token_url = "https://ops.epo.org/3.2/auth/accesstoken"
         try:
-            resp = requests.post(
+            resp = _http_session().post(
                 token_url,
                 data={"grant_type": "client_credentials"},
                 auth=(consumer_key, consumer_secret),
@@ -237,7 +274,7 @@ class GooglePatentsSearchTool(BaseTool):
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
         try:
-            response = requests.get(url, headers=headers, timeout=30)
+            response = _http_session().get(url, headers=headers, timeout=30)
             response.raise_for_status()            
             soup = BeautifulSoup(response.text, 'html.parser')            
             # Encontra todos os resultados de pesquisa na página
@@ -293,7 +330,7 @@ class INPI_PatentSearchTool(BaseTool):
             "Referer": "https://busca.inpi.gov.br/pePI/jsp/patentes/PatenteSearchAvancado.jsp"
         }
         try:
-            response = requests.post(base_url, data=payload, headers=headers, timeout=45)
+            response = _http_session().post(base_url, data=payload, headers=headers, timeout=45)
             response.raise_for_status()
             return response, None
         except requests.exceptions.RequestException as e:
@@ -365,6 +402,27 @@ class INPI_PatentSearchTool(BaseTool):
         except TypeError as e:
             return json.dumps({"error": f"Erro ao serializar os dados extraídos: {e}"})
 
+# Caminho até a lista de documentos em uma resposta agregada do EPO OPS
+_EPO_DOCS_PATH = (
+    'ops:world-patent-data', 'ops:biblio-search', 'ops:search-result',
+    'exchange-documents', 'exchange-document',
+)
+
+
+def _dig(obj, path: tuple, default=None):
+    """Percorre `path` em dicts aninhados; devolve `default` no primeiro nível ausente.
+
+    Substitui cadeias `.get(k, {}).get(...)`, sem criar dicts vazios a cada nível.
+    """
+    for key in path:
+        if not isinstance(obj, dict):
+            return default
+        obj = obj.get(key)
+        if obj is None:
+            return default
+    return obj
+
+
 # tools/custom_tools.py
 class IPDataCollectorTool(BaseTool):
     name: str = "IP Data Collector Tool"
@@ -397,10 +455,15 @@ class IPDataCollectorTool(BaseTool):
             if not isinstance(it, dict):
                 continue
             cloned = copy.deepcopy(it)
-            cloned = self._ensure_source(cloned, provider)
-            raw_id = db.insert_search_result_raw(search_query_id, provider, cloned)
+            results.append(self._ensure_source(cloned, provider))
+        # Todos os itens do provedor em um único INSERT
+        raw_ids = db.insert_search_results_raw_bulk(search_query_id, provider, results)
+        for cloned, raw_id in zip(results, raw_ids):
             cloned['db_raw_id'] = raw_id
-            results.append(cloned)
+        failed = sum(1 for raw_id in raw_ids if raw_id < 0)
+        if failed:
+            # Itens sem resultado bruto persistido não podem ser classificados: registra a perda
+            db.insert_search_logs([(search_query_id, f"Erro {provider}: {failed} de {len(results)} resultados brutos não foram persistidos e serão descartados.")])
         return results
 
     def _run(self, task_input: str) -> str:
@@ -548,8 +611,7 @@ class NLPClassificationTool(BaseTool):
                 continue
 
             # Caso 3: EPO agregado (mantém a lógica existente)
-            search_result = response.get('ops:world-patent-data', {}).get('ops:biblio-search', {}).get('ops:search-result', {})
-            epo_docs = search_result.get('exchange-documents', {}).get('exchange-document', [])
+            epo_docs = _dig(response, _EPO_DOCS_PATH)
             if isinstance(epo_docs, list) and epo_docs:
                 db_raw_id = response.get('db_raw_id')
                 for doc in epo_docs:
@@ -679,12 +741,19 @@ class NLPClassificationTool(BaseTool):
             return json.dumps([{"message": "Nenhum item de resultado pôde ser extraído dos dados brutos."}])
 
         classified_data = []
+        structured_rows = []
+        dropped = 0
         db = BuscapiDB()
 
         try:
             # Etapa 2: Classificação e persistência dos dados achatados
             for item in flattened_results:
-                if not isinstance(item, dict) or 'db_raw_id' not in item:
+                # Cada item carrega o id do seu resultado bruto (db_raw_id, anexado pelo coletor):
+                # a ligação não depende da posição. -1 indica falha ao persistir o bruto.
+                if not isinstance(item, dict):
+                    continue
+                if not isinstance(item.get('db_raw_id'), int) or item['db_raw_id'] < 0:
+                    dropped += 1
                     continue
 
                 # --- 1. Classificação por Categoria ---
@@ -721,17 +790,23 @@ class NLPClassificationTool(BaseTool):
                 # Garante que o título não exceda o limite do banco de dados
                 safe_title = (item.get("title", "N/A") or "N/A")[:255]
 
-                db.insert_search_result_structured(
-                    search_result_raw_id=item['db_raw_id'],
-                    category=item.get('category', 'Outros'),
-                    title=safe_title,
-                    date_found=parsed_date,
-                    applicant=item.get('applicantName'),
-                    summary=item.get('abstract') or item.get('snippet'),
-                    structured_json=item
-                )
+                structured_rows.append((
+                    item['db_raw_id'],
+                    item.get('category', 'Outros'),
+                    safe_title,
+                    parsed_date,
+                    item.get('applicantName'),
+                    item.get('abstract') or item.get('snippet'),
+                    item,
+                ))
                 classified_data.append(item)
+
+            # Todos os resultados estruturados em um único INSERT
+            db.insert_search_results_structured_bulk(structured_rows)
         finally:
+            if dropped:
+                # A perda já foi registrada no search_log pelo coletor (por fonte)
+                print(f"Aviso: {dropped} itens sem resultado bruto persistido não foram classificados.")
             db.close()
             
         return json.dumps(classified_data)
@@ -748,10 +823,19 @@ class DataAnalysisTool(BaseTool):
             return json.dumps({"error": f"Erro ao processar dados para análise: {e}"})
 
         analysis_results = {}
+        # Escalares usados nos insights, tirados das contagens já calculadas aqui (sem nova
+        # passada sobre count_by_category/count_by_year por quem consome a análise)
+        precomputed = {}
 
         if not df.empty:
             if 'category' in df.columns:
-                analysis_results['count_by_category'] = df['category'].value_counts().to_dict()
+                category_counts = df['category'].value_counts()
+                analysis_results['count_by_category'] = category_counts.to_dict()
+                if not category_counts.empty:
+                    # value_counts já vem em ordem decrescente
+                    precomputed['most_common_category'] = category_counts.index[0]
+                    precomputed['most_common_count'] = int(category_counts.iloc[0])
+                    precomputed['category_total'] = int(category_counts.sum())
 
             date_column = None
             if 'filingDate' in df.columns:
@@ -762,12 +846,21 @@ class DataAnalysisTool(BaseTool):
             if date_column:
                 try:
                     df['year'] = pd.to_datetime(df[date_column], errors='coerce').dt.year
-                    analysis_results['count_by_year'] = df['year'].value_counts().sort_index().to_dict()
+                    year_counts = df['year'].value_counts().sort_index()
+                    analysis_results['count_by_year'] = year_counts.to_dict()
+                    if len(year_counts) > 1:
+                        first_count, latest_count = int(year_counts.iloc[0]), int(year_counts.iloc[-1])
+                        precomputed['trend'] = "crescente" if latest_count > first_count else "decrescente"
+                        precomputed['latest_year'] = int(year_counts.index[-1])
+                        precomputed['latest_year_count'] = latest_count
                 except Exception as e:
                     analysis_results['date_parsing_error'] = str(e)
 
             analysis_results['total_records'] = len(df)
 
+        if precomputed:
+            analysis_results['_insights_precomputed'] = precomputed
+
         return json.dumps(analysis_results)
 
 class VisualizationTool(BaseTool):
@@ -834,39 +927,59 @@ class VisualizationTool(BaseTool):
             return json.dumps({"error": "Tipo de plotagem ou dados de análise inválidos."})
 
 
+# Override do modelo LLM para a invocação corrente. Por ser um ContextVar, cada thread/
+# tarefa asyncio enxerga o próprio valor; None significa "usar LLM_MODEL do ambiente".
+llm_model: ContextVar[Optional[str]] = ContextVar('llm_model', default=None)
+
+
+@lru_cache(maxsize=4)
+def _openai_client(api_key: str):
+    """Cliente OpenAI (SDK >= 1.0) reaproveitado por chave, mantendo o pool HTTP entre chamadas."""
+    try:
+        import openai
+        client_cls = openai.OpenAI
+    except Exception:
+        raise RuntimeError("Biblioteca openai (>= 1.0) não instalada")
+    return client_cls(api_key=api_key)
+
+
+def _openai_api_key() -> str:
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        raise RuntimeError('OPENAI_API_KEY não configurada')
+    return api_key
+
+
 class LLMTool(BaseTool):
     """Ferramenta LLM leve para gerar/otimizar insights a partir de análise/classificados.
 
-    Usa OpenAI ChatCompletion quando disponível (variável OPENAI_API_KEY e package openai).
+    Usa a API de chat da OpenAI quando disponível (variável OPENAI_API_KEY e package openai).
     Caso contrário, usa um fallback heurístico simples.
     """
     name: str = "LLM Assistant Tool"
     description: str = "Gera ou melhora insights a partir de análise e dados classificados (modelo configurável via LLM_MODEL no .env)."
 
     def _call_openai_chat(self, messages: list, model: str | None = None, max_tokens: int = 512) -> str:
-        try:
-            import openai
-        except Exception:
-            raise RuntimeError("Biblioteca openai não instalada")
-
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise RuntimeError('OPENAI_API_KEY não configurada')
-
-        openai.api_key = api_key
-        # Determina o modelo a partir da variável de ambiente LLM_MODEL ou do parâmetro
-        env_model = os.getenv('LLM_MODEL')
+        client = _openai_client(_openai_api_key())
+        # Determina o modelo a partir do override da invocação (llm_model), da variável
+        # de ambiente LLM_MODEL ou do parâmetro
+        override = llm_model.get()
+        env_model = override if override is not None else os.getenv('LLM_MODEL')
         model_to_use = env_model or model or "gpt-5-nano"
         # Tenta usar a API de chat padrão
-        resp = openai.ChatCompletion.create(model=model_to_use, messages=messages, max_tokens=max_tokens)
+        resp = client.chat.completions.create(model=model_to_use, messages=messages, max_tokens=max_tokens)
         # Extrai conteúdo de forma defensiva
         try:
             return resp.choices[0].message.content
         except Exception:
-            try:
-                return resp.choices[0].text
-            except Exception:
-                raise RuntimeError('Resposta inesperada do LLM')
+            raise RuntimeError('Resposta inesperada do LLM')
+
+    def _call_openai_embedding(self, text: str, model: str | None = None) -> list:
+        """Calcula o embedding de `text` (usado pelo cache semântico de insights)."""
+        client = _openai_client(_openai_api_key())
+        model_to_use = model or os.getenv('LLM_EMBEDDING_MODEL') or "text-embedding-3-small"
+        resp = client.embeddings.create(model=model_to_use, input=text)
+        return resp.data[0].embedding
 
     def _heuristic_insights(self, analysis: dict, classified: list) -> str:
         if not analysis:
@@ -893,7 +1006,11 @@ class LLMTool(BaseTool):
         parts.append("Recomendação: revisar documentos da categoria principal para priorizar ações de proteção.")
         return " ".join(parts)
 
-    def _run(self, input_data: str) -> str:
+    def _build_messages(self, input_data) -> Tuple[list, dict, list]:
+        """Monta as mensagens do chat a partir da entrada da ferramenta.
+
+        Retorna (messages, analysis, classified).
+        """
         # input_data é um JSON string ou dict com 'analysis' e/ou 'classified'
         try:
             payload = json.loads(input_data) if isinstance(input_data, str) else (input_data or {})
@@ -918,16 +1035,20 @@ class LLMTool(BaseTool):
                 pass
 
         user_msg = "\n\n".join(user_parts) or "Sem contexto"
+        messages = [{"role": "system", "content": system_msg}, {"role": "user", "content": user_msg}]
+        return messages, analysis or {}, classified or []
 
-        # Tenta chamar LLM; se falhar, usa heurística
+    def _run(self, input_data: str) -> str:
+        messages, analysis, classified = self._build_messages(input_data)
+
+        # Tenta chamar LLM; se falhar, usa heurística (marcada com "fallback" para não ser
+        # tratada como resposta do modelo, ex: no cache de insights do IPAgents)
         try:
-            messages = [{"role": "system", "content": system_msg}, {"role": "user", "content": user_msg}]
             text = self._call_openai_chat(messages)
-            insights = text.strip()
+            return json.dumps({"insights": text.strip()}, ensure_ascii=False)
         except Exception:
-            insights = self._heuristic_insights(analysis or {}, classified or [])
-
-        return json.dumps({"insights": insights}, ensure_ascii=False)
+            insights = self._heuristic_insights(analysis, classified)
+            return json.dumps({"insights": insights, "fallback": True}, ensure_ascii=False)
 
 
 class PDFReportTool(BaseTool):
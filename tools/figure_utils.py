@@ -0,0 +1,57 @@
+import plotly.io as pio
+import plotly.graph_objects as go
+
+from tools import json_utils
+
+try:
+    from svglib.svglib import svg2rlg
+except Exception:
+    svg2rlg = None
+
+
+# Formato dos gráficos exportados para o PDF. SVG evita a rasterização no Kaleido e
+# é embutido como vetor pelo PDFGenerator (via svglib); sem svglib, volta ao PNG.
+CHART_IMAGE_EXT = 'svg' if svg2rlg is not None else 'png'
+
+
+def _from_json(viz_json):
+    # JSON (str ou bytes) que representa uma figura Plotly
+    try:
+        return pio.from_json(viz_json)
+    except Exception:
+        # tentar carregar como dict/lista e seguir pelos casos abaixo
+        parsed = json_utils.loads(viz_json)
+        builder = _FIG_BUILDERS.get(type(parsed))
+        return builder(parsed) if builder in (_from_dict, _from_list) else None
+
+
+def _from_dict(viz_json: dict):
+    # Figura completa ou dict de traces
+    try:
+        return go.Figure(viz_json)
+    except Exception:
+        # fallback: se dict contém 'data'/'layout'
+        return go.Figure(data=viz_json.get('data', []), layout=viz_json.get('layout', {}))
+
+
+def _from_list(viz_json: list):
+    # Lista de traces
+    return go.Figure(data=viz_json)
+
+
+# Tipo do payload -> construtor da figura
+_FIG_BUILDERS = {
+    str: _from_json,
+    bytes: _from_json,
+    dict: _from_dict,
+    list: _from_list,
+}
+
+
+def to_figure(viz_json):
+    """Converte o payload de uma visualização (JSON em str/bytes, dict ou lista de traces) em `go.Figure`.
+
+    Retorna None para formatos desconhecidos.
+    """
+    builder = _FIG_BUILDERS.get(type(viz_json))
+    return builder(viz_json) if builder else None
@@ -0,0 +1,56 @@
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+
+# Erro de decodificação comum às duas implementações (orjson.JSONDecodeError herda dele)
+JSONDecodeError = json.JSONDecodeError
+
+if orjson is not None:
+    # Chaves não-string (ex: anos como int) e arrays numpy aparecem nos dados de análise
+    _ORJSON_OPTS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+else:
+    _ORJSON_OPTS = 0
+
+
+def dumps_bytes(obj: Any, sort_keys: bool = False, indent: bool = False) -> bytes:
+    """Serializa `obj` para JSON em UTF-8 (bytes).
+
+    Usa `orjson` quando disponível; caso contrário (ou se o orjson recusar o objeto,
+    ex: inteiros acima de 64 bits) recorre ao `json` da biblioteca padrão com o mesmo
+    formato compacto. Objetos não serializáveis são convertidos com `str`.
+    """
+    if orjson is not None:
+        opts = _ORJSON_OPTS
+        if sort_keys:
+            opts |= orjson.OPT_SORT_KEYS
+        if indent:
+            opts |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=str, option=opts)
+        except TypeError:
+            pass
+    return json.dumps(
+        obj,
+        ensure_ascii=False,
+        default=str,
+        sort_keys=sort_keys,
+        indent=2 if indent else None,
+        separators=None if indent else (',', ':'),
+    ).encode('utf-8')
+
+
+def dumps(obj: Any, sort_keys: bool = False, indent: bool = False) -> str:
+    """Mesmo que `dumps_bytes`, retornando `str`."""
+    return dumps_bytes(obj, sort_keys=sort_keys, indent=indent).decode('utf-8')
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    """Desserializa JSON a partir de `str` ou `bytes`."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
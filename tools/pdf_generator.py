@@ -13,6 +13,11 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
 
+try:
+    from svglib.svglib import svg2rlg
+except Exception:
+    svg2rlg = None
+
 
 class PDFGenerator:
     """
@@ -305,8 +310,7 @@ class PDFGenerator:
                         story.append(Paragraph(viz_title, self.styles['SectionHeader']))
                         
                         # Adicionar imagem
-                        img = Image(viz_path, width=6*inch, height=4*inch)
-                        story.append(img)
+                        story.append(self._chart_flowable(viz_path))
                         story.append(Spacer(1, 15))
                     except Exception as e:
                         print(f"⚠️ Erro ao adicionar visualização {viz_name}: {e}")
@@ -319,6 +323,27 @@ class PDFGenerator:
                                  self.styles['Normal']))
             story.append(Spacer(1, 15))
     
+    def _chart_flowable(self, viz_path: str, width: float = 6*inch, height: float = 4*inch):
+        """
+        Cria o elemento do gráfico no tamanho padrão do relatório.
+        
+        Arquivos SVG são embutidos como desenho vetorial (svglib), sem rasterização;
+        os demais formatos são inseridos como imagem.
+        
+        Args:
+            viz_path: Caminho do arquivo do gráfico
+            width: Largura final do gráfico
+            height: Altura final do gráfico
+        """
+        if svg2rlg is not None and viz_path.lower().endswith('.svg'):
+            drawing = svg2rlg(viz_path)
+            if drawing is not None and drawing.width and drawing.height:
+                sx, sy = width / drawing.width, height / drawing.height
+                drawing.scale(sx, sy)
+                drawing.width, drawing.height = width, height
+                return drawing
+        return Image(viz_path, width=width, height=height)
+    
     def _add_detailed_results_section(self, story: List, results: Dict[str, Any]):
         """
         Adiciona a seção de resultados detalhados.
@@ -337,6 +362,9 @@ class PDFGenerator:
             story.append(Paragraph("Métricas de Análise:", self.styles['SectionHeader']))
             
             for key, value in analysis_results.items():
+                if key.startswith('_'):
+                    # Campos auxiliares (ex: '_insights_precomputed') não são métricas
+                    continue
                 if isinstance(value, dict):
                     # Se o valor é um dicionário, criar uma tabela
                     story.append(Paragraph(f"{key.replace('_', ' ').title()}:", 